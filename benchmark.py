@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+from sys import argv
+import time
+import tracemalloc
+
+# 生成测试世界时使用的方块 ID
+BEDROCK, DIRT, GRASS, LEAF, LOG = 1, 2, 3, 4, 5
+# 生成器使用的方块名称到 ID 的映射, 平坦世界中未知的方块用泥土代替
+TEST_IDS = {'bedrock': BEDROCK, 'dirt': DIRT, 'grass': GRASS, 'leaf': LEAF, 'log': LOG, 'missing': DIRT}
+# 以方块 ID 为下标的透明属性, 0 号为空气
+TEST_TRANSPARENT = [True, False, False, False, True, False]
+
+def main():
+    # 用法: python3 benchmark.py [名称...], 不指定名称时运行全部测试
+    names = argv[1:] or list(benchmarks.keys())
+    for name in names:
+        if name not in benchmarks:
+            print("No such benchmark: '%s'" % name)
+            print('Available: %s' % ', '.join(benchmarks.keys()))
+            exit(1)
+    for name in names:
+        print('[%s]' % name)
+        benchmarks[name]()
+
+def gen_terrain(store, seed=0):
+    # 按照 World.init_random_world 的地形公式填充 store
+    from opensimplex import OpenSimplex
+    from minecraft.utils.utils import MAX_SIZE, SEA_LEVEL
+
+    simplex = OpenSimplex(seed=seed)
+    for x in range(-MAX_SIZE, MAX_SIZE + 1):
+        for z in range(-MAX_SIZE, MAX_SIZE + 1):
+            store[(x, 0, z)] = BEDROCK
+            h = int(simplex.noise2(x=x / 25, y=z / 25) * 3 + SEA_LEVEL)
+            for y in range(1, h + 1):
+                store[(x, y, z)] = DIRT
+            store[(x, h + 1, z)] = GRASS
+
+def make_store(generator, chunks):
+    # 返回用 generator 生成了 chunks 中各区块的 ChunkStore, 方块为不依赖 OpenGL 的 _MeshBlock
+    from minecraft.world.chunk import ChunkStore
+
+    palette = [None] + [_MeshBlock(i, TEST_TRANSPARENT[i]) for i in range(1, len(TEST_TRANSPARENT))]
+    store = ChunkStore(palette, TEST_TRANSPARENT)
+    for cx, cz in chunks:
+        store.load_chunk(cx, cz, *generator.generate(cx, cz)[:2])
+    return store
+
+def measure(func):
+    # 返回 func 运行期间新分配且仍存活的内存(字节)和耗时(秒)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+def bench_memory():
+    # 比较字典存储和区块存储在 MAX_SIZE 世界上的内存占用
+    from minecraft.world.chunk import ChunkStore
+
+    def dict_store():
+        store = dict()
+        gen_terrain(store)
+        return store
+
+    def chunk_store():
+        store = ChunkStore([None] * 4, [True, False, False, False])
+        gen_terrain(_IdSetter(store))
+        return store
+
+    store, dict_size, dict_time = measure(dict_store)
+    count = len(store)
+    del store
+    store, chunk_size, chunk_time = measure(chunk_store)
+    assert len(store) == count
+    print('blocks: %d' % count)
+    print('dict:  %8.2f MB, %.2f s' % (dict_size / 1048576, dict_time))
+    print('chunk: %8.2f MB, %.2f s' % (chunk_size / 1048576, chunk_time))
+    print('ratio: %.2fx' % (dict_size / max(1, chunk_size)))
+
+
+def bench_terrain():
+    # 比较逐列标量生成和按区块向量化生成随机地形的耗时
+    from opensimplex import OpenSimplex
+    from minecraft.utils.utils import SEA_LEVEL, SECTOR_SIZE
+    from minecraft.world.chunk import ChunkStore
+    from minecraft.world.generator import RandomGenerator
+
+    def scalar(size):
+        # 旧的 World.init_random_world: 每列三次 noise2, 每个方块写入一次
+        store = ChunkStore([None] * 4, [True, False, False, False])
+        simplex = OpenSimplex(seed=0)
+        trees = []
+        for x in range(-size, size + 1):
+            for z in range(-size, size + 1):
+                store.set_id((x, 0, z), BEDROCK)
+                h = int(simplex.noise2(x=x / 25, y=z / 25) * 3 + SEA_LEVEL)
+                if (0.511 < simplex.noise2(x=x, y=z) < 0.512) or (0.301 < simplex.noise2(x=x, y=z) < 0.302):
+                    trees.append((x, z))
+                for y in range(1, h + 1):
+                    store.set_id((x, y, z), DIRT)
+                store.set_id((x, h + 1, z), GRASS)
+        return store
+
+    def vectorized(size):
+        store = ChunkStore([None] * 4, [True, False, False, False])
+        generator = RandomGenerator(0, TEST_IDS)
+        for cx in range(-size // SECTOR_SIZE, size // SECTOR_SIZE + 1):
+            for cz in range(-size // SECTOR_SIZE, size // SECTOR_SIZE + 1):
+                # 只比较地形, 树木的位置同样要计算但不放置
+                xs, zs, height, inside = generator.get_columns(cx, cz, size)
+                generator.get_trees(xs, zs)
+                store.load_chunk(cx, cz, *generator.get_terrain(height, inside))
+        return store
+
+    for size in (16, 32, 64):
+        start = time.perf_counter()
+        a = scalar(size)
+        scalar_time = time.perf_counter() - start
+        start = time.perf_counter()
+        b = vectorized(size)
+        vector_time = time.perf_counter() - start
+        assert len(a) == len(b)
+        print('size %3d: scalar %6.2f s, vectorized %6.2f s, %.1fx' % (size, scalar_time,
+            vector_time, scalar_time / max(vector_time, 1e-9)))
+
+
+def bench_workers():
+    # 比较主线程逐个生成区块和进程池并行生成区块的吞吐量
+    from concurrent.futures import ProcessPoolExecutor
+    from os import cpu_count
+    from minecraft.world.generator import RandomGenerator, generate_chunk
+
+    chunks = [(cx, cz) for cx in range(-8, 8) for cz in range(-8, 8)]
+    start = time.perf_counter()
+    generator = RandomGenerator(0, TEST_IDS)
+    serial = [generator.generate(cx, cz) for cx, cz in chunks]
+    serial_time = time.perf_counter() - start
+    with ProcessPoolExecutor() as executor:
+        # 先让工作进程启动, 不计入耗时
+        list(executor.map(generate_chunk, [0] * cpu_count(), [TEST_IDS] * cpu_count(), [0] * cpu_count(), [0] * cpu_count()))
+        start = time.perf_counter()
+        parallel = list(executor.map(generate_chunk, *zip(*[(0, TEST_IDS, cx, cz) for cx, cz in chunks])))
+        parallel_time = time.perf_counter() - start
+    assert all(a[0] == b[0] and (a[1] == b[1]).all() for a, b in zip(serial, parallel))
+    print('chunks: %d, workers: %d' % (len(chunks), cpu_count()))
+    print('serial:   %6.2f s, %6.1f chunks/s' % (serial_time, len(chunks) / serial_time))
+    print('parallel: %6.2f s, %6.1f chunks/s' % (parallel_time, len(chunks) / parallel_time))
+
+
+def bench_greedy():
+    # 比较逐方块网格和贪婪网格在平坦世界与随机世界上的顶点数和耗时
+    from minecraft.world.generator import FlatGenerator, RandomGenerator
+    from minecraft.world.mesh import build_sector_mesh, build_sector_mesh_greedy
+
+    chunks = [(cx, cz) for cx in range(-4, 4) for cz in range(-4, 4)]
+    for name, generator in (('flat', FlatGenerator('classic', TEST_IDS)), ('random', RandomGenerator(0, TEST_IDS))):
+        store = make_store(generator, chunks)
+        sectors = [sector for sector in store.sectors() if -4 <= sector[0] < 3 and -4 <= sector[2] < 3]
+        results = []
+        for build in (build_sector_mesh, build_sector_mesh_greedy):
+            start = time.perf_counter()
+            vertices = sum(data[0] for sector in sectors for data in build(store, sector, None).values())
+            results.append((vertices, time.perf_counter() - start))
+        (naive, naive_time), (greedy, greedy_time) = results
+        print('%-6s sectors: %3d, naive %7d vertices %5.2f s, greedy %7d vertices %5.2f s, %.1fx fewer' % (name,
+            len(sectors), naive, naive_time, greedy, greedy_time, naive / max(greedy, 1)))
+
+
+def bench_mesh():
+    # 比较逐方块生成网格和用面模板按区域向量化生成网格, 每秒能处理的可见方块数
+    from minecraft.utils.utils import get_color_by_brightness
+    from minecraft.world.generator import RandomGenerator
+    from minecraft.world.mesh import build_sector_mesh, cull_faces
+
+    def per_block(store, sector, get_tint):
+        # 旧的 build_sector_mesh: 每个方块生成 72 个坐标的列表, 再复制纹理坐标和颜色
+        mesh = dict()
+        for position in store.sector_positions(sector, exposed=True):
+            block = store[position]
+            faces = store.get_faces(position)
+            if block.transparent:
+                faces = cull_faces(store, position, block.id, faces)
+                if faces == 0:
+                    continue
+            texture_data = _select_faces(faces, block.texture_data)
+            count = len(texture_data) // 2
+            data = mesh.setdefault((block.transparent, block.group), [0, [], [], []])
+            data[0] += count
+            data[1].extend(_select_faces(faces, block.get_vertices(*position)))
+            data[2].extend(texture_data)
+            data[3].extend(get_color_by_brightness(16) * count)
+        return mesh
+
+    store = make_store(RandomGenerator(0, TEST_IDS), [(cx, cz) for cx in range(-4, 4) for cz in range(-4, 4)])
+    sectors = [sector for sector in store.sectors() if -4 <= sector[0] < 3 and -4 <= sector[2] < 3]
+    blocks = sum(1 for sector in sectors for _ in store.sector_positions(sector, exposed=True))
+    results = []
+    for build in (per_block, build_sector_mesh):
+        start = time.perf_counter()
+        vertices = sum(data[0] for sector in sectors for data in build(store, sector, None).values())
+        results.append((vertices, time.perf_counter() - start))
+    assert results[0][0] == results[1][0]
+    print('sectors: %d, exposed blocks: %d, vertices: %d' % (len(sectors), blocks, results[0][0]))
+    print('per block:  %6.2f s, %9.0f blocks/s' % (results[0][1], blocks / results[0][1]))
+    print('vectorized: %6.2f s, %9.0f blocks/s' % (results[1][1], blocks / results[1][1]))
+
+
+def bench_light():
+    # 比较方块改变后 LightEngine.update 和重新计算周围区块光照的耗时, 分别测试单个方块, TNT 炸出的 5x5x5 空洞
+    # 和挖出的 9x9x9 空洞, 最后一种超过 RELIGHT_LIMIT, update 会改为重新计算周围区块
+    import random
+    from minecraft.world.generator import RandomGenerator
+    from minecraft.world.light import LightEngine
+
+    chunks = [(cx, cz) for cx in range(-4, 4) for cz in range(-4, 4)]
+    store = make_store(RandomGenerator(0, TEST_IDS), chunks)
+    light = LightEngine(store, [0] * len(TEST_TRANSPARENT))
+    start = time.perf_counter()
+    for cx, cz in chunks:
+        light.load_chunk(cx, cz)
+    print('chunks: %d, initial light %.2f s, %.1f chunks/s' % (len(chunks), time.perf_counter() - start,
+        len(chunks) / (time.perf_counter() - start)))
+    random.seed(0)
+    for name, radius, count in (('single', 0, 200), ('tnt', 2, 20), ('large', 4, 10)):
+        incremental = full = relit = 0
+        for _ in range(count):
+            x, z = random.randint(-60, 59), random.randint(-60, 59)
+            y = store.get_height(x, z) - radius
+            positions = [(x + dx, y + dy, z + dz) for dx in range(-radius, radius + 1)
+                    for dy in range(-radius, radius + 1) for dz in range(-radius, radius + 1)]
+            for position in positions:
+                store.set_id(position, 0)
+            start = time.perf_counter()
+            relit += len(light.update(positions))
+            incremental += time.perf_counter() - start
+            # 不做增量更新时, 光照可能传到相邻区块, 要重新计算涉及的区块及其四周的区块
+            start = time.perf_counter()
+            nearby = set((p[0] // 16 + dx, p[2] // 16 + dz) for p in positions for dx in (-1, 0, 1)
+                    for dz in (-1, 0, 1)) & set(chunks)
+            for chunk in nearby:
+                light.unload_chunk(*chunk)
+            for chunk in nearby:
+                light.load_chunk(*chunk)
+            full += time.perf_counter() - start
+        print('%-6s edits: %3d, relit %6.1f blocks/edit, update %6.2f ms, 3x3 chunks relight %6.2f ms, %.1fx' % (
+            name, count, relit / count, incremental / count * 1000, full / count * 1000, full / max(incremental, 1e-9)))
+
+
+def _select_faces(faces, data):
+    # 旧的 build_sector_mesh 使用的函数, 按可见面掩码选出方块数据中可见的面
+    if faces == 0b111111:
+        return list(data)
+    n = len(data) // 6
+    result = []
+    for i in range(6):
+        if faces & (1 << i):
+            result.extend(data[i * n: (i + 1) * n])
+    return result
+
+
+class _MeshBlock():
+    # 不依赖 OpenGL 的方块, 只提供生成网格所需的属性
+    texture_data = [0.0] * 48
+
+    def __init__(self, block_id, transparent):
+        self.id = block_id
+        self.transparent = transparent
+        self.group = block_id
+        self.face_groups = [(block_id, 'top'), (block_id, 'bottom')] + [(block_id, 'side')] * 4
+
+    def get_vertices(self, x, y, z):
+        from minecraft.utils.utils import cube_vertices
+        return cube_vertices(x, y, z, 1, 1)
+
+
+class _IdSetter():
+    # 让 gen_terrain 直接写入方块 ID
+    def __init__(self, store):
+        self._store = store
+
+    def __setitem__(self, position, block_id):
+        self._store.set_id(position, block_id)
+
+
+benchmarks = {
+        'memory': bench_memory,
+        'terrain': bench_terrain,
+        'workers': bench_workers,
+        'greedy': bench_greedy,
+        'mesh': bench_mesh,
+        'light': bench_light
+    }
+
+if __name__ == '__main__':
+    main()
@@ -134,6 +134,8 @@ def install_settings():
     MCPYPATH = search_mcpy()
     source = {
             'fov': 70,
+            'greedy-mesh': False,
+            'render-distance': 8,
             'lang': 'en_us',
             'resource-pack': ['(default)'],
             'use-theme': 'arc', 
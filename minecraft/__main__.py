@@ -1,15 +1,17 @@
 import os
 from os import getpid, environ
 
-from minecraft.start import *
-from minecraft.utils import *
-
 def exist(p):
     for process_name in ['python', 'py', 'python3', 'py3']:
         if p.name() == process_name and p.cmdline()[:3] == [process_name, '-m', 'minecraft'] and p.pid != getpid():
             return True
 
 if __name__ == '__main__':
+    # 只在主进程中导入游戏. 以 spawn 方式启动的区块生成进程会重新执行本模块,
+    # 放在这里可以避免每个工作进程都创建 GL 上下文并载入全部贴图
+    from minecraft.start import *
+    from minecraft.utils import *
+
     try:
         import psutil
         for p in psutil.process_iter():
@@ -10,17 +10,56 @@ from minecraft.block.missing import Missing
 from minecraft.block.plank import Plank
 from minecraft.block.sand import Sand
 from minecraft.block.tnt import TNT
+from minecraft.block.texture import init_block_group
 
-blocks = dict()
-blocks['bedrock'] = Bedrock()
-blocks['brick'] = Brick()
-blocks['crafting_table'] = CraftingTable()
-blocks['dirt'] = Dirt()
-blocks['glass'] = Glass()
-blocks['grass'] = Grass()
-blocks['leaf'] = Leaf()
-blocks['log'] = Log()
-blocks['missing'] = Missing()
-blocks['plank'] = Plank()
-blocks['sand'] = Sand()
-blocks['tnt'] = TNT()
+block_classes = {
+        'bedrock': Bedrock,
+        'brick': Brick,
+        'crafting_table': CraftingTable,
+        'dirt': Dirt,
+        'glass': Glass,
+        'grass': Grass,
+        'leaf': Leaf,
+        'log': Log,
+        'missing': Missing,
+        'plank': Plank,
+        'sand': Sand,
+        'tnt': TNT
+    }
+# 所有方块的贴图放进同一个图集, 必须在创建方块之前完成
+init_block_group([name for cls in block_classes.values() for name in cls.textures])
+blocks = dict((name, cls()) for name, cls in block_classes.items())
+
+# 方块 ID 注册表, ID 会保存到存档中, 新方块只能追加到末尾
+block_names = ['air', 'bedrock', 'brick', 'crafting_table', 'dirt', 'glass', 'grass',
+        'leaf', 'log', 'missing', 'plank', 'sand', 'tnt']
+# 方块名称到 ID 的映射
+block_ids = dict()
+# 以下列表都以方块 ID 为下标, 0 号为空气
+block_list = list()
+block_transparent = list()
+block_hardness = list()
+block_luminance = list()
+block_colored = list()
+
+for block_id, name in enumerate(block_names):
+    block = blocks.get(name)
+    block_ids[name] = block_id
+    block_list.append(block)
+    if block is None:
+        block_transparent.append(True)
+        block_hardness.append(0)
+        block_luminance.append(0)
+        block_colored.append(False)
+    else:
+        block.id = block_id
+        block_transparent.append(block.transparent)
+        block_hardness.append(block.hardness)
+        block_luminance.append(block.luminance)
+        block_colored.append(hasattr(block, 'get_color'))
+
+def get_block_id(block):
+    # 返回方块名称或 ID 对应的方块 ID, 不存在的方块返回 missing 的 ID
+    if isinstance(block, int):
+        return block if 0 <= block < len(block_list) else block_ids['missing']
+    return block_ids.get(block, block_ids['missing'])
@@ -1,11 +1,13 @@
 from ctypes import byref
 from math import floor
 
-from minecraft.block.texture import BlockTextureGroup
+from minecraft.block.texture import RepeatTextureGroup, get_block_group
 from minecraft.source import resource_pack
 from minecraft.utils.nbt import NBT
 from minecraft.utils.utils import *
 
+import numpy as np
+import pyglet
 from pyglet.gl import *
 
 
@@ -26,12 +28,16 @@ class Block():
     position = (0, 0, 0)
     # 名称
     name = ''
+    # 方块 ID, 由 minecraft.block 注册表分配
+    id = 0
     # 方块信息
     _nbt = NBT()
     # 透明
     transparent = False
     # 硬度
     hardness = 1
+    # 发光等级, 0 到 15
+    luminance = 0
     # 名称
     name = 'default'
 
@@ -52,9 +58,10 @@ class Block():
 
     def update_texture(self):
         if self.textures:
-            self.group = BlockTextureGroup(self.textures)
-        if self.group:
-            self.texture_data = self.group.texture_data
+            self.group = get_block_group()
+            self.texture_data = self.group.get_texture_data(self.textures)
+            # 六个面各自使用的可平铺贴图组, 用于贪婪网格
+            self.face_groups = [RepeatTextureGroup.get(self.textures[min(i, len(self.textures) - 1)]) for i in range(6)]
         if self.top_texture == ():
             return
         if self.front_texture is None:
@@ -92,6 +99,7 @@ class Block():
 class BlockColorizer():
 
     def __init__(self, name):
+        self.name = name
         self.color_data = resource_pack.get_resource('textures/colormap/%s' % name)
         if self.color_data is None:
             return
@@ -110,6 +118,23 @@ class BlockColorizer():
                 float(self.color_data[pos + 1]) / 255,
                 float(self.color_data[pos + 2]) / 255)
 
+    def get_colors(self, temp, rainfall):
+        """
+        get_color 的数组版本, 一次求出多列的颜色
+
+        :param: temp, rainfall 形状相同的温度和湿度数组
+        :return: 在原形状后加上长度为 3 的一维的 RGB 数组
+        """
+        temp = 1 - np.asarray(temp, dtype=np.float64)
+        rainfall = np.asarray(rainfall, dtype=np.float64)
+        delta = np.maximum(temp + rainfall - 1, 0) / 2
+        temp, rainfall = temp - delta, rainfall - delta
+        if self.color_data is None:
+            return np.ones(temp.shape + (3,))
+        data = np.frombuffer(self.color_data, dtype=np.uint8)
+        pos = (np.floor(rainfall * 255) * 768 + 3 * np.floor(temp * 255)).astype(np.int64)
+        return data[pos[..., None] + np.arange(3)] / 255
+
 
 _fbo = None
 
@@ -9,8 +9,12 @@ class Grass(Block):
     textures = 'grass_top', 'dirt', 'grass_side', 'grass_side'
 
     def get_color(self, temp, rainfall, brightness=16):
+        return self.get_tinted_color(self.colorizer.get_color(temp, rainfall), brightness)
+
+    def get_tinted_color(self, tint, brightness=16):
+        # tint 是预先按气候求出的颜色
         color = []
-        color.extend(get_color_by_brightness(brightness, self.colorizer.get_color(temp, rainfall)) * 4)
+        color.extend(get_color_by_brightness(brightness, tint) * 4)
         color.extend(get_color_by_brightness(brightness) * 20)
         return color
 
@@ -1,7 +1,6 @@
 from minecraft.source import resource_pack
 from minecraft.utils.utils import *
 
-from pyglet.image.atlas import TextureAtlas
 from pyglet.graphics import Group
 from pyglet.gl import *
 
@@ -16,68 +15,112 @@ def get_texture_coord(x, y, size=16):
 
 
 class BlockTextureGroup(Group):
+    """
+    所有方块共用的贴图组, 贴图都在 ResourcePackManager.make_block_atlas 创建的同一个图集中,
+    绘制地形时每个渲染层只需绑定一次纹理
 
-    def __init__(self, names, width=1.0, height=1.0, bgcolor=None):
+    :param: names 所有方块用到的贴图名称
+    """
+
+    def __init__(self, names):
         super(BlockTextureGroup, self).__init__()
-        self.atlas = None
-        self.texture_data = []
-        self.block_texture = {}
+        self.texture, self.regions = resource_pack.make_block_atlas(names)
+        # 过滤方式是纹理的属性, 创建时设置一次即可
+        glBindTexture(self.texture.target, self.texture.id)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glBindTexture(self.texture.target, 0)
+
+    def get_texture_data(self, names, width=1.0, height=1.0):
+        """
+        返回方块六个面在图集中的纹理坐标
+
+        :param: names 按顶部, 底部, 四边的顺序排列的贴图名称, 不足六个时用最后一个补齐
+        :param: width, height 方块的大小, 小于 1 时只取贴图的一部分
+        """
+        texture_data = []
         for name in names:
-            if name == 'missing':
-                self.block_texture[name] = resource_pack.get_resource('textures/misc/missing_texture')
-            else:
-                self.block_texture[name] = resource_pack.get_resource('textures/block/%s' % name)
-            size = self.block_texture[name].width
-            if bgcolor is not None:
-                data = bytearray(self.block_texture[name].get_image_data().get_data('RGBA', size * 4))
-                for i in range(len(data)):
-                    if data[i] == bgcolor:
-                        data[i] = 0
-                else:
-                    self.block_texture[name].get_image_data().set_data('RGBA', size * 4, bytes(data))
-            if self.atlas == None:
-                self.atlas = TextureAtlas(size * len(names), size)
-                self.texture = self.atlas.texture
-            subtex = self.atlas.add(self.block_texture[name])
-            i = 0
-            for value in subtex.tex_coords:
-                i += 1
-                if i % 3 != 0:
-                    self.texture_data.append(value)
-        if self.atlas == None:
-            self.atlas = TextureAtlas(1, 1)
-        self.texture = self.atlas.texture
-        self.texture_data += self.texture_data[-8:] * (6 - len(names))
+            texture_data.extend(value for i, value in enumerate(self.regions[name].tex_coords) if i % 3 != 2)
+        texture_data += texture_data[-8:] * (6 - len(names))
         # 调整贴图大小
-        if height != 1.0 or width != 1.0:
-            if len(self.texture_data) == 0:
-                return
-            else:
-                tex_width = tex_height = self.texture_data[2] - self.texture_data[0]
-                w_margin = tex_height * (1.0 - width) / 2
-                h_margin = tex_height * (1.0 - height)
-                # 顶部和底部
-                for i in (0, 1):
-                    for j in (0, 1, 3, 6):
-                        self.texture_data[i * 8 + j] += w_margin
-                    for j in (2, 4, 5, 7):
-                        self.texture_data[i * 8 + j] -= w_margin
-                # 四边
-                for i in range(2, 6):
-                    for j in (0, 6):
-                        self.texture_data[i * 8 + j] += w_margin
-                    for j in (2, 4):
-                        self.texture_data[i * 8 + j] -= w_margin
-                    for j in (5, 7):
-                        self.texture_data[i * 8 + j] -= h_margin
-    
+        if (height != 1.0 or width != 1.0) and texture_data:
+            tex_height = texture_data[2] - texture_data[0]
+            w_margin = tex_height * (1.0 - width) / 2
+            h_margin = tex_height * (1.0 - height)
+            # 顶部和底部
+            for i in (0, 1):
+                for j in (0, 1, 3, 6):
+                    texture_data[i * 8 + j] += w_margin
+                for j in (2, 4, 5, 7):
+                    texture_data[i * 8 + j] -= w_margin
+            # 四边
+            for i in range(2, 6):
+                for j in (0, 6):
+                    texture_data[i * 8 + j] += w_margin
+                for j in (2, 4):
+                    texture_data[i * 8 + j] -= w_margin
+                for j in (5, 7):
+                    texture_data[i * 8 + j] -= h_margin
+        return texture_data
+
+    def set_state(self):
+        glBindTexture(self.texture.target, self.texture.id)
+        glEnable(self.texture.target)
+
+    def unset_state(self):
+        glDisable(self.texture.target)
+
+
+# 所有方块共用的贴图组, 由 init_block_group 创建
+_block_group = None
+
+def init_block_group(names):
+    # 用所有方块的贴图创建共用的贴图组, 必须在创建方块之前调用
+    global _block_group
+    _block_group = BlockTextureGroup(names)
+    return _block_group
+
+def get_block_group():
+    # 返回所有方块共用的贴图组
+    return _block_group
+
+
+class RepeatTextureGroup(Group):
+    """
+    单张方块贴图的贴图组, 纹理坐标超出 0 到 1 时重复贴图.
+    贪婪网格把多个面合并为一个大的四边形, 图集中的贴图无法这样平铺, 所以每张贴图单独使用一个纹理
+
+    :param: name 贴图名称
+    """
+    _groups = {}
+
+    @classmethod
+    def get(cls, name):
+        # 每张贴图只创建一个贴图组, 使相同贴图的面可以合并到同一个顶点列表
+        if name not in cls._groups:
+            cls._groups[name] = cls(name)
+        return cls._groups[name]
+
+    def __init__(self, name):
+        super(RepeatTextureGroup, self).__init__()
+        self.name = name
+        self.texture = None
+
     def set_state(self):
-        if self.texture:
+        # 纹理在第一次绘制时才创建
+        if self.texture is None:
+            if self.name == 'missing':
+                image = resource_pack.get_resource('textures/misc/missing_texture')
+            else:
+                image = resource_pack.get_resource('textures/block/%s' % self.name)
+            self.texture = image.get_texture()
             glBindTexture(self.texture.target, self.texture.id)
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
             glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-            glEnable(self.texture.target)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glBindTexture(self.texture.target, self.texture.id)
+        glEnable(self.texture.target)
 
     def unset_state(self):
-        if self.texture:
-            glDisable(self.texture.target)
+        glDisable(self.texture.target)
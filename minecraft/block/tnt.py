@@ -7,6 +7,6 @@ class TNT(Block):
     name = 'tnt'
     textures = 'tnt_top', 'tnt_bottom', 'tnt_side', 'tnt_side'
 
-    def on_use(self):
-        get_game().entities.add_entity(ExplodingTNT(self.position))
+    def on_use(self, fuse=4):
+        get_game().entities.add_entity(ExplodingTNT(self.position, fuse))
         get_game().world.remove_block(self.position)
@@ -21,36 +21,36 @@ class ExplodingTNT(Entity):
     def explode(self):
         #if math.dist(get_game().player['position'], self._data['position']) <= 2:
             #get_game().player.die('game.text.die.exploded')
+        # 先收集被炸毁的方块, 最后一次性移除
+        world = get_game().world
+        removed = list()
         for pos_x in range(-1, 2):
             for pos_y in range(-1, 2):
                 for pos_z in range(-1, 2):
-                    block = get_game().world.get((round(self._data['position'][0] + pos_x),
+                    position = (round(self._data['position'][0] + pos_x),
                         round(self._data['position'][1] + pos_y),
-                        round(self._data['position'][2] + pos_z)))
+                        round(self._data['position'][2] + pos_z))
+                    block = world.get(position)
                     if block:
                         if block.hardness > 0:
                             if (block.name == 'tnt'):
-                                get_game().world.get((round(self._data['position'][0] + pos_x),
-                                    round(self._data['position'][1] + pos_y),
-                                    round(self._data['position'][2] + pos_z))).on_use()
-                            get_game().world.remove_block((round(self._data['position'][0] + pos_x),
-                                round(self._data['position'][1] + pos_y),
-                                round(self._data['position'][2] + pos_z)))
+                                block.position = position
+                                block.on_use()
+                            removed.append((position, 0))
         for pos_x in range(-2, 3):
             for pos_y in range(-2, 3):
                 for pos_z in range(-2, 3):
-                    block = get_game().world.get((round(self._data['position'][0] + pos_x),
+                    position = (round(self._data['position'][0] + pos_x),
                         round(self._data['position'][1] + pos_y),
-                        round(self._data['position'][2] + pos_z)))
+                        round(self._data['position'][2] + pos_z))
+                    block = world.get(position)
                     if block:
                         if block.name == 'tnt':
-                            get_game().world.get((round(self._data['position'][0] + pos_x),
-                                round(self._data['position'][1] + pos_y),
-                                round(self._data['position'][2] + pos_z))).on_use(random.randint(40, 50) / 10)
+                            block.position = position
+                            block.on_use(random.randint(40, 50) / 10)
                         if (block.hardness > 0) and (random.randint(0, 9) >= 5):
-                            get_game().world.remove_block((round(self._data['position'][0] + pos_x),
-                                round(self._data['position'][1] + pos_y),
-                                round(self._data['position'][2] + pos_z)))
+                            removed.append((position, 0))
+        world.set_many(removed)
 
     def on_update(self, dt):
         super().on_update(dt)
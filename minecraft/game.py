@@ -38,6 +38,7 @@ try:
     from minecraft.utils.opengl import change_sky_color, toggle_blind
     from minecraft.utils.utils import *
 
+    import numpy
     import psutil
     import pyshaders
     import opensimplex
@@ -53,6 +54,8 @@ class Game(pyglet.window.Window):
         super().__init__(*args, **kwargs)
         # 是否初始化
         self.is_init = True
+        # 分阶段加载世界的生成器
+        self.loader = None
         # 窗口是否捕获鼠标
         self.exclusive = False
         # 鼠标位置
@@ -200,6 +203,9 @@ class Game(pyglet.window.Window):
 
         :param: dt 距上次调用的时间
         """
+        if self.is_init:
+            # 世界还没有加载完成, 保存会丢失尚未应用的更改
+            return
         saves.save_block(self.save_name, self.world.change)
         saves.save_player(self.save_name, self.player['position'], self.player['respawn_position'],
                 normalize(self.player['rotation']), self.player['now_block'])
@@ -295,12 +301,14 @@ class Game(pyglet.window.Window):
                 self._update(dt / m)
 
     def update_status(self, dt):
-        # 这个函数定时改变世界状态
-        for sector in self.world.sectors.values():
-            if sector:
-                blocks = random.choices(sector, k=3)
-                for block in blocks:
-                    self.world.get(block).on_ticking(block)
+        # 这个函数定时改变世界状态, 在每个正在显示的区域中随机选取3个方块
+        if self.is_init:
+            return
+        for sector in list(self.world.shown):
+            for position in self.world.world.random_positions(sector, 3):
+                block = self.world.get(position)
+                if block is not None:
+                    block.on_ticking(position)
 
     def _update(self, dt):
         """
@@ -338,6 +346,7 @@ class Game(pyglet.window.Window):
     def on_close(self):
         # 当玩家关闭窗口时调用
         saves.save_window(self.width, self.height)
+        self.world.shutdown()
         pyglet.app.exit()
 
     def on_die(self):
@@ -456,7 +465,8 @@ class Game(pyglet.window.Window):
         glViewport(0, 0, max(1, viewport[0]), max(1, viewport[1]))
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
-        gluPerspective(self.player['fov'], width / float(height), 0.1, 60.0)
+        # 远平面比雾的终点多出两个区域, 视距边缘的区块不会被突然裁掉
+        gluPerspective(self.player['fov'], width / float(height), 0.1, (settings['render-distance'] + 2) * SECTOR_SIZE)
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
         x, y = self.player['rotation']
@@ -491,15 +501,25 @@ class Game(pyglet.window.Window):
             for func in self.event.get('on_draw', {}).values():
                 func()
         if self.is_init:
-            self.world.init_world()
-            self.init_gui()
-            for func in self.event.get('on_init', {}).values():
-                func()
-            self.is_init = False
-            self.set_icon(get_block_icon(blocks['crafting_table'], 64))
-            if len(self.player['position']) != 3:
-                self.player['position'] = self.player['respawn_position'] = (0, self.world.get_highest_block(0, 0) + 3, 0)
-            self.sector = sectorize(self.player['position'])
+            self.load_world()
+            self.loading.draw()
+
+    def load_world(self):
+        # 每一帧推进一段时间的世界加载, 加载完成后初始化 GUI
+        if self.loader is None:
+            self.loader = self.world.init_world()
+        start = time.perf_counter()
+        for stage, progress in self.loader:
+            self.loading.set_progress(stage, progress)
+            if time.perf_counter() - start >= 1.0 / 30:
+                return
+        self.loader = None
+        self.init_gui()
+        for func in self.event.get('on_init', {}).values():
+            func()
+        self.is_init = False
+        self.sector = sectorize(self.player['position'])
+        self.set_icon(get_block_icon(blocks['crafting_table'], 64))
 
     def on_text(self, text):
         for func in self.event.get('on_text', {}).values():
@@ -542,6 +562,8 @@ class Game(pyglet.window.Window):
                 text = text.replace('%(version)', VERSION['str']).replace('%(info)', ', '.join(self._info_ext))
                 text = text.replace('%(xyz)', '%.1f, %.1f, %.1f' % (x, y, z)).replace('%(rot)', '%.2f, %.2f' % (rx, ry))
                 text = text.replace('%(mem)', '%.2f' % mem).replace('%(fps)', '%d' % fps)
+                text = text.replace('%(tri)', '%d / %d' % (self.world.triangles, self.world.full_triangles))
+                text = text.replace('%(sec)', '%d drawn, %d culled' % (self.world.drawn_sectors, self.world.culled_sectors))
                 self.label['top'].text = text
                 self.label['top'].draw()
 
@@ -1,8 +1,8 @@
 from minecraft.gui.base import GUI
+from minecraft.gui.widget.label import ColorLabel
 from minecraft.source import resource_pack
 from minecraft.utils.utils import *
 
-import pyglet
 from pyglet.sprite import Sprite
 
 
@@ -18,6 +18,19 @@ class Loading(GUI):
                 sprite = Sprite(self._img, x=x * self._img.width, y = y * self._img.height)
                 sprite.scale = 2
                 self._element.append(sprite)
+        # 加载进度
+        self._label = ColorLabel(resource_pack.get_translation('game.text.loading'),
+                x=width // 2, y=height // 2, anchor_x='center', anchor_y='center')
+
+    def set_progress(self, stage, progress):
+        """
+        显示加载进度
+
+        :param: stage 加载阶段, 见 utils 中的 LOADING_*
+        :param: progress 该阶段的进度, 取值 0 到 1
+        """
+        self._label.text = '%s %d%%' % (resource_pack.get_translation('game.text.loading.stage')[stage],
+                int(progress * 100))
 
     def resize(self, width, height):
         self._element = list()
@@ -26,7 +39,10 @@ class Loading(GUI):
                 sprite = Sprite(self._img, x=x * self._img.width, y = y * self._img.height)
                 sprite.scale = 2
                 self._element.append(sprite)
+        self._label.x = width // 2
+        self._label.y = height // 2
 
     def draw(self):
         for i in self._element:
             i.draw()
+        self._label.draw()
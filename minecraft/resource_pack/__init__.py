@@ -5,6 +5,10 @@ from minecraft.resource_pack.directory import DirectoryResourcePack
 from minecraft.resource_pack.zipfile import ZipfileResourcePack
 from minecraft.utils.utils import *
 
+import numpy as np
+from pyglet.image import ImageData
+from pyglet.image.atlas import TextureAtlas
+
 
 class ResourcePackManager():
 
@@ -56,5 +60,45 @@ class ResourcePackManager():
         else:
             raise FileNotFoundError("No such resource: '%s'" % path)
 
-    def make_block_atlas(self):
-        pass
+    def make_block_atlas(self, names):
+        """
+        把所有方块贴图放进同一个纹理图集, 每个贴图按资源包的顺序查找, 只加载一次
+
+        :param: names 贴图名称, 'missing' 表示缺失贴图
+        :return: (纹理, 字典), 字典的键为贴图名称, 值为贴图在图集中的区域
+        """
+        images = dict()
+        for name in names:
+            if name not in images:
+                if name == 'missing':
+                    images[name] = self.get_resource('textures/misc/missing_texture')
+                else:
+                    images[name] = self.get_resource('textures/block/%s' % name)
+        # 资源包中的贴图分辨率可能不同, 全部缩放到最大的分辨率, 图集按相同大小的格子排列
+        tile = max([min(image.width, image.height) for image in images.values()] or [16])
+        # 图集的边长取 2 的幂, 至少能放下所有贴图
+        side = tile
+        while (side // tile) ** 2 < len(images):
+            side *= 2
+        atlas = TextureAtlas(side, side)
+        return atlas.texture, dict((name, atlas.add(scale_tile(image, tile))) for name, image in images.items())
+
+
+def scale_tile(image, size):
+    """
+    把贴图变为 size x size 的正方形, 用最近邻采样缩放以保持像素风格.
+    不是正方形的贴图(例如竖直排列的动画贴图)只取最上方的一帧
+
+    :param: image pyglet 图像
+    :param: size 边长
+    :return: pyglet 图像
+    """
+    if image.width == image.height == size:
+        return image
+    side = min(image.width, image.height)
+    data = image.get_image_data()
+    # pyglet 的图像数据从最下面一行开始
+    pixels = np.frombuffer(data.get_data('RGBA', data.width * 4), dtype=np.uint8).reshape(data.height, data.width, 4)
+    pixels = pixels[data.height - side:, :side]
+    index = np.arange(size) * side // size
+    return ImageData(size, size, 'RGBA', np.ascontiguousarray(pixels[index][:, index]).tobytes())
@@ -1,28 +1,43 @@
 import json
 from os.path import isfile, join
 
+from minecraft.block import block_names, get_block_id
 from minecraft.source import saves_path, player
 from minecraft.utils.utils import *
 
 
-def load_block(name):
+def load_changes(name):
     """
-    读取游戏方块数据(该 API 将在下一个版本中废除)
+    读取玩家对方块的更改
 
-    :param: name 存档名, 为 JSON 文件
+    :param: name 存档名
+    :return: 列表, 元素为 (坐标, 方块 ID 或方块名称), 可直接传给 World.set_many
     """
     blocks = json.load(open(join(saves_path, name, 'world.json')))
+    # 存档中的方块 ID 到当前方块 ID 的映射
+    remap = [get_block_id(block) for block in load_palette(name)]
+    changes = list()
     for position, block in blocks.items():
-        position = str2pos(position)
-        if block == 'air':
-            get_game().world.remove_block(position)
-        else:
-            get_game().world.add_block(position, block)
+        if isinstance(block, int):
+            block = remap[block] if block < len(remap) else get_block_id('missing')
+        changes.append((str2pos(position), block))
+    return changes
+
+def get_chunk_cache_path(name):
+    # 返回存档中区块缓存的目录
+    return join(saves_path, name, 'chunks')
 
 def load_level(name):
     # 读取世界信息
     return json.load(open(join(saves_path, name, 'level.json')))
 
+def load_palette(name):
+    # 读取存档的方块调色板, 下标为存档中的方块 ID, 值为方块名称
+    if isfile(join(saves_path, name, 'palette.json')):
+        return json.load(open(join(saves_path, name, 'palette.json')))
+    else:
+        return block_names
+
 def load_player(name):
     # 读取玩家数据
     if isfile(join(saves_path, name, 'players', '%s.json' % player['id'])):
@@ -56,7 +71,7 @@ def save_block(name, change, full=True):
     """
     将方块数据存入文件
 
-    :param: change 方块数据, 符合 JSON 标准的 python 字典
+    :param: change 方块数据, 值为方块 ID 的 python 字典
     :param: full 是否全部写入
     """
     data = dict()
@@ -67,6 +82,11 @@ def save_block(name, change, full=True):
     else:
         data = change
     json.dump(data, open(join(saves_path, name, 'world.json'), 'w+'))
+    save_palette(name)
+
+def save_palette(name):
+    # 将方块 ID 与名称的对应关系存入文件
+    json.dump(block_names, open(join(saves_path, name, 'palette.json'), 'w+'))
 
 def save_entity(name, data):
     # 将实体信息存入文件
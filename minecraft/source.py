@@ -29,6 +29,11 @@ if settings['fov'] < 50:
 elif settings['fov'] > 100:
     settings['fov'] = 100
 
+# render-distance 设置, 以区域为单位
+if not isinstance(settings.get('render-distance'), int):
+    settings['render-distance'] = 8
+settings['render-distance'] = min(max(settings['render-distance'], 2), 32)
+
 # resource-pack 设置
 resource_pack = ResourcePackManager()
 for pack in settings['resource-pack']:
@@ -141,7 +141,10 @@ class StartScreen(Tk):
                 world.write('{}\n')
                 world.close()
                 world_level = {'data_version': VERSION['data'], 'seed': seed, 'type': world_type,
-                        'time': 400, 'weather': {'now': 'clear', 'duration': 600}}
+                        'infinite': world_type == 'random', 'time': 400, 'weather': {'now': 'clear', 'duration': 600}}
+                if world_type == 'flat':
+                    # 平坦世界的层预设, 也可以改为 [方块名称, 层数] 列表
+                    world_level['layers'] = 'classic'
                 json.dump(world_level, open(os.path.join(saves_path, name, 'level.json'), 'w+'))
                 os.mkdir(os.path.join(saves_path, name, 'players'))
                 player_info = {'position': '0', 'respawn': '0', 'now_block': 0}
@@ -204,7 +207,7 @@ class StartScreen(Tk):
             game = Game(width=max(data['width'], 800), height=max(data['height'], 600),
                     caption='Minecraft %s [pyVAPE]' % VERSION['str'], resizable=True)
             game.set_name(select)
-            setup_opengl()
+            setup_opengl(settings['render-distance'] * SECTOR_SIZE)
             pyglet.app.run()
         except SystemExit:
             pass
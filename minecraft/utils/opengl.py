@@ -1,11 +1,25 @@
 from minecraft.utils.utils import *
 
+import numpy as np
 from pyglet.image import Texture
 from pyglet.gl import *
 
 _is_blind = False
+# 雾的终点, 由视距决定
+_fog_end = 60.0
+# 光照贴图, 16x16 的纹理, 横坐标为天空光照, 纵坐标为方块光照, 每个像素是组合后的亮度
+_lightmap = None
+# 夜晚天空光照保留的比例
+NIGHT_LIGHT = 0.2
 
-def setup_opengl():
+def setup_opengl(distance=60.0):
+    """
+    设置 OpenGL 的初始状态
+
+    :param: distance 视距(方块), 雾从视距的一半开始, 到视距处完全遮挡远处的方块
+    """
+    global _fog_end
+    _fog_end = float(distance)
     glClearColor(0.5, 0.69, 1.0, 1)
     glEnable(GL_BLEND)
     glEnable(GL_CULL_FACE)
@@ -14,8 +28,8 @@ def setup_opengl():
     glEnable(GL_POLYGON_SMOOTH)
     glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
     glFogfv(GL_FOG_COLOR, (GLfloat * 4)(0.5, 0.69, 1.0, 1))
-    glFogf(GL_FOG_START, 30.0)
-    glFogf(GL_FOG_END, 60.0)
+    glFogf(GL_FOG_START, _fog_end / 2)
+    glFogf(GL_FOG_END, _fog_end)
     glFogi(GL_FOG_MODE, GL_LINEAR)
     glHint(GL_POLYGON_SMOOTH_HINT, GL_NICEST)
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
@@ -23,6 +37,7 @@ def setup_opengl():
     glHint(GL_FOG_HINT, GL_DONT_CARE)
     Texture.default_min_filter = GL_NEAREST
     Texture.default_mag_filter = GL_NEAREST
+    update_lightmap(1.0)
 
 def toggle_blind(change=True):
     global _is_blind
@@ -34,8 +49,8 @@ def toggle_blind(change=True):
         glFogf(GL_FOG_END, 3)
     else:
         change_sky_color(0)
-        glFogf(GL_FOG_START, 30)
-        glFogf(GL_FOG_END, 60)
+        glFogf(GL_FOG_START, _fog_end / 2)
+        glFogf(GL_FOG_END, _fog_end)
 
 def is_blind():
     return _is_blind
@@ -54,6 +69,82 @@ def change_sky_color(dt):
     g = get_color_g(now)
     b = get_color_b(now)
     glClearColor(r, g, b, 1.0)
+    # 日光强度与天空的绿色分量同步变化, 正午为 1
+    update_lightmap(NIGHT_LIGHT + (1 - NIGHT_LIGHT) * max(0.0, g / 0.69))
     if is_blind():
         glFogfv(GL_FOG_COLOR, (GLfloat * 4)(r, g, b, 1.0))
         toggle_blind(False)
+
+def update_lightmap(daylight):
+    """
+    按日光强度重新生成光照贴图. 地形的每个顶点只保存天空光照和方块光照的等级,
+    昼夜变化只需要更新这 256 个像素, 不用重新生成任何网格
+
+    :param: daylight 日光强度, 天空光照乘以它之后再与方块光照取较大值, 取值 0 到 1
+    """
+    global _lightmap
+    if _lightmap is None:
+        _lightmap = Texture.create(16, 16, GL_RGB)
+        glBindTexture(_lightmap.target, _lightmap.id)
+        glTexParameteri(_lightmap.target, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(_lightmap.target, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+    level = np.maximum(np.arange(16)[None, :] * daylight, np.arange(16)[:, None])
+    # 与 get_color_by_brightness 相同, 亮度为光照等级加 1
+    value = np.minimum(0.1 + (level + 1) * 0.05625, 1.0)
+    data = np.ascontiguousarray(np.repeat(value[:, :, None] * 255, 3, axis=2).astype(np.uint8))
+    glBindTexture(_lightmap.target, _lightmap.id)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexSubImage2D(_lightmap.target, 0, 0, 0, 16, 16, GL_RGB, GL_UNSIGNED_BYTE, data.ctypes.data)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+    glBindTexture(_lightmap.target, 0)
+
+def enable_lightmap():
+    # 在第二个纹理单元上启用光照贴图, 与第一个纹理单元的方块贴图相乘
+    glActiveTexture(GL_TEXTURE1)
+    glEnable(_lightmap.target)
+    glBindTexture(_lightmap.target, _lightmap.id)
+    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+    glActiveTexture(GL_TEXTURE0)
+
+def disable_lightmap():
+    # 停用第二个纹理单元上的光照贴图
+    glActiveTexture(GL_TEXTURE1)
+    glDisable(_lightmap.target)
+    glActiveTexture(GL_TEXTURE0)
+
+def get_frustum():
+    """
+    从当前的投影矩阵和模型视图矩阵中提取视锥体, 必须在 set_3d 之后调用
+
+    :return: 形状为 (6, 4) 的数组, 每行是一个平面 (a, b, c, d), 视锥体内的点满足 ax + by + cz + d >= 0
+    """
+    projection, modelview = (GLfloat * 16)(), (GLfloat * 16)()
+    glGetFloatv(GL_PROJECTION_MATRIX, projection)
+    glGetFloatv(GL_MODELVIEW_MATRIX, modelview)
+    # OpenGL 的矩阵按列存储
+    m = np.array(projection, dtype=np.float64).reshape(4, 4).T @ np.array(modelview, dtype=np.float64).reshape(4, 4).T
+    return np.array([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+
+def sectors_in_frustum(frustum, sectors):
+    """
+    判断区域是否与视锥体相交
+
+    :param: frustum get_frustum 的返回值
+    :param: sectors 区域坐标的列表
+    :return: 与 sectors 等长的布尔数组
+    """
+    low = np.array(sectors, dtype=np.float64).reshape(-1, 3) * SECTOR_SIZE - 0.5
+    return boxes_in_frustum(frustum, low, low + SECTOR_SIZE)
+
+def boxes_in_frustum(frustum, low, high):
+    """
+    判断包围盒是否与视锥体相交. 对每个平面只检查包围盒在法线方向上最远的顶点,
+    它在平面外侧时整个包围盒都在视锥体外
+
+    :param: frustum get_frustum 的返回值
+    :param: low, high 形状为 (n, 3) 的数组, 包围盒的最小和最大坐标
+    :return: 长度为 n 的布尔数组
+    """
+    normals = frustum[:, :3]
+    corners = np.where(normals[None] >= 0, high[:, None], low[:, None])
+    return ((corners * normals[None]).sum(axis=2) + frustum[None, :, 3] >= 0).all(axis=1)
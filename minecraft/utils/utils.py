@@ -1,5 +1,6 @@
 import atexit
 import math
+import multiprocessing
 import time
 
 start_time = time.strftime('%Y-%m-%d_%H.%M.%S')
@@ -13,8 +14,6 @@ except ModuleNotFoundError:
 else:
     _have_color = True
 
-import pyglet
-
 def cube_vertices(x, y, z, bottom, height, offset=(0, 0, 0)):
     # 返回在 x, y, z 坐标的方形顶点
     b, h = bottom / 2, height / 2
@@ -53,6 +52,8 @@ def tex_coords(top, bottom, side0, side1=None, n=1):
 
 def get_size():
     # 返回窗口大小
+    # 在用到时才导入 pyglet, 生成区块的子进程也会导入本模块, 它们不需要 pyglet
+    import pyglet
     for w in pyglet.canvas.get_display().get_windows():
         if str(w).startswith('Game'):
             return w.width, w.height
@@ -61,6 +62,7 @@ def get_size():
 
 def get_game():
     # 获取 Game 类
+    import pyglet
     for w in pyglet.canvas.get_display().get_windows():
         if str(w).startswith('Game'):
             return w
@@ -124,6 +126,9 @@ def normalize(position):
 
 @atexit.register
 def on_exit():
+    # 生成区块的子进程退出时不保存日志, 否则会覆盖主进程的日志
+    if multiprocessing.parent_process() is not None:
+        return
     _os  = __import__('os')
     log_info("Save logs to 'log/log-%s.log'" % start_time)
     log_info('Exit')
@@ -153,10 +158,9 @@ def search_mcpy():
     return MCPYPATH
 
 def sectorize(position):
-    # 返回坐标所在的区块
+    # 返回坐标所在的区域, 每个区域是 16x16x16 的立方体
     x, y, z = normalize(position)
-    x, y, z = x // SECTOR_SIZE, y // SECTOR_SIZE, z // SECTOR_SIZE
-    return (x, 0, z)
+    return (x // SECTOR_SIZE, y // SECTOR_SIZE, z // SECTOR_SIZE)
 
 def str2pos(string, float_=False):
     # pos2str 的逆函数
@@ -187,6 +191,12 @@ SECTOR_SIZE = 16
 
 MAX_SIZE = 32
 SEA_LEVEL = 10
+# 超过该距离(区域)的区块只绘制低精度网格
+LOD_DISTANCE = 4
+# 无限世界中已生成区块占用内存的上限(字节)
+CHUNK_MEMORY_LIMIT = 256 * 1048576
+# 加载世界的各个阶段: 生成地形, 应用玩家的更改, 绘制出生点
+LOADING_GENERATE, LOADING_CHANGES, LOADING_MESH = range(3)
 
 STEALING_SPEED = 3
 WALKING_SPEED = 5
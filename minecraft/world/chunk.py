@@ -0,0 +1,395 @@
+from array import array
+from itertools import compress
+
+from minecraft.utils.utils import *
+
+import numpy as np
+
+# 建筑高度限制, 最低 -64 格(含), 最高 512 格(不含)
+MIN_HEIGHT = -64
+MAX_HEIGHT = 512
+# 每个区段是 16x16x16 的立方体
+SECTION_VOLUME = SECTOR_SIZE ** 3
+SECTION_COUNT = (MAX_HEIGHT - MIN_HEIGHT) // SECTOR_SIZE
+# 最低区段的 y 区域坐标
+SECTION_OFFSET = MIN_HEIGHT // SECTOR_SIZE
+
+
+class Section(object):
+    # 区段, 用一个紧凑的数组存储 16x16x16 个方块 ID, 0 表示空气
+    __slots__ = ('blocks', 'faces', 'count')
+
+    def __init__(self):
+        self.blocks = array('H', [0]) * SECTION_VOLUME
+        # 可见面掩码, 第 i 位表示 FACES[i] 方向的面是否可见
+        self.faces = array('B', [0]) * SECTION_VOLUME
+        # 非空气方块的数量
+        self.count = 0
+
+
+class Chunk(object):
+    # 区块, 一列 16x16 宽、从 MIN_HEIGHT 到 MAX_HEIGHT 高的区段
+    # 区段在第一次放置方块时才分配内存
+    __slots__ = ('x', 'z', 'sections', 'count', 'heightmap')
+
+    def __init__(self, x, z):
+        self.x, self.z = x, z
+        self.sections = [None] * SECTION_COUNT
+        self.count = 0
+        # 高度图, 记录每一列最高方块的 y 坐标, 空列为 MIN_HEIGHT - 1
+        self.heightmap = array('h', [MIN_HEIGHT - 1]) * (SECTOR_SIZE ** 2)
+
+    def get(self, x, y, z):
+        # 返回世界坐标 x, y, z 处的方块 ID
+        section = self.sections[(y - MIN_HEIGHT) >> 4]
+        if section is None:
+            return 0
+        return section.blocks[((y & 15) << 8) | ((z & 15) << 4) | (x & 15)]
+
+    def set(self, x, y, z, block_id):
+        # 设置世界坐标 x, y, z 处的方块 ID, 返回原来的 ID
+        i = (y - MIN_HEIGHT) >> 4
+        section = self.sections[i]
+        if section is None:
+            if block_id == 0:
+                return 0
+            section = self.sections[i] = Section()
+        index = ((y & 15) << 8) | ((z & 15) << 4) | (x & 15)
+        old = section.blocks[index]
+        section.blocks[index] = block_id
+        column = ((z & 15) << 4) | (x & 15)
+        if old == 0 and block_id != 0:
+            section.count += 1
+            self.count += 1
+            if y > self.heightmap[column]:
+                self.heightmap[column] = y
+        elif old != 0 and block_id == 0:
+            section.faces[index] = 0
+            section.count -= 1
+            self.count -= 1
+            if section.count == 0:
+                # 区段被清空时释放内存
+                self.sections[i] = None
+            if y == self.heightmap[column]:
+                self.heightmap[column] = self._find_top(x, y - 1, z)
+        return old
+
+    def get_faces(self, x, y, z):
+        # 返回世界坐标 x, y, z 处方块的可见面掩码
+        section = self.sections[(y - MIN_HEIGHT) >> 4]
+        if section is None:
+            return 0
+        return section.faces[((y & 15) << 8) | ((z & 15) << 4) | (x & 15)]
+
+    def set_faces(self, x, y, z, faces):
+        section = self.sections[(y - MIN_HEIGHT) >> 4]
+        section.faces[((y & 15) << 8) | ((z & 15) << 4) | (x & 15)] = faces
+
+    def set_face(self, x, y, z, face, visible):
+        # 设置 x, y, z 处方块 face 方向的面是否可见
+        section = self.sections[(y - MIN_HEIGHT) >> 4]
+        index = ((y & 15) << 8) | ((z & 15) << 4) | (x & 15)
+        if visible:
+            section.faces[index] |= 1 << face
+        else:
+            section.faces[index] &= ~(1 << face)
+
+    def _find_top(self, x, y, z):
+        # 从 y 向下寻找 x, z 列中最高的方块, 跳过空的区段
+        column = ((z & 15) << 4) | (x & 15)
+        while y >= MIN_HEIGHT:
+            i = (y - MIN_HEIGHT) >> 4
+            section = self.sections[i]
+            if section is None:
+                y = MIN_HEIGHT + i * SECTOR_SIZE - 1
+                continue
+            blocks = section.blocks
+            for dy in range(y & 15, -1, -1):
+                if blocks[(dy << 8) | column]:
+                    return (y & ~15) + dy
+            y = (y & ~15) - 1
+        return MIN_HEIGHT - 1
+
+    def get_height(self, x, z):
+        # 返回世界坐标 x, z 列中最高方块的 y 坐标, 空列返回 MIN_HEIGHT - 1
+        return self.heightmap[((z & 15) << 4) | (x & 15)]
+
+    def get_blocks(self, bottom, height):
+        # 以 NumPy 数组返回 y 从 bottom 开始、高 height 的方块 ID, 下标为 [y, z, x]
+        result = np.zeros((height, SECTOR_SIZE, SECTOR_SIZE), dtype=np.uint16)
+        for y in range(max(bottom, MIN_HEIGHT) & ~15, min(bottom + height, MAX_HEIGHT), SECTOR_SIZE):
+            section = self.sections[(y - MIN_HEIGHT) >> 4]
+            if section is None:
+                continue
+            view = section_view(section.blocks, np.uint16)
+            lo, hi = max(y, bottom), min(y + SECTOR_SIZE, bottom + height)
+            result[lo - bottom: hi - bottom] = view[lo - y: hi - y]
+        return result
+
+
+def section_view(data, dtype):
+    # 把区段数组包装成形状为 (16, 16, 16) 的 NumPy 视图, 下标为 [y, z, x], 修改视图会修改原数组
+    return np.frombuffer(data, dtype=dtype).reshape((SECTOR_SIZE, SECTOR_SIZE, SECTOR_SIZE))
+
+
+class ChunkStore(object):
+    """
+    按区块存储世界上所有方块, 代替以 (x, y, z) 为键的字典
+
+    它提供和字典相同的接口(get, in, [], del), 值为方块对象,
+    在内部每个方块只占用两个字节的方块 ID.
+    每个方块还保存着一个 6 位的可见面掩码, 在方块改变时只更新它和相邻的方块.
+
+    :param: palette 以方块 ID 为下标的方块对象列表, 0 号为空气
+    :param: transparent 以方块 ID 为下标的方块透明属性列表
+    """
+
+    def __init__(self, palette, transparent):
+        self.chunks = {}
+        self.palette = palette
+        self.transparent = transparent
+
+    def get_id(self, position):
+        # 返回 position 处的方块 ID, 空气或超出建筑限制返回 0
+        x, y, z = position
+        if not MIN_HEIGHT <= y < MAX_HEIGHT:
+            return 0
+        chunk = self.chunks.get((x >> 4, z >> 4))
+        if chunk is None:
+            return 0
+        return chunk.get(x, y, z)
+
+    def set_id(self, position, block_id):
+        # 设置 position 处的方块 ID, 返回原来的 ID
+        x, y, z = position
+        if not MIN_HEIGHT <= y < MAX_HEIGHT:
+            raise IndexError('y out of range: %d' % y)
+        key = (x >> 4, z >> 4)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            if block_id == 0:
+                return 0
+            chunk = self.chunks[key] = Chunk(*key)
+        old = chunk.set(x, y, z, block_id)
+        if chunk.count == 0:
+            del self.chunks[key]
+        if old != block_id:
+            self._update_faces(x, y, z, old, block_id)
+        return old
+
+    def is_opaque(self, block_id):
+        # 不透明的方块会遮挡相邻方块的面
+        return block_id != 0 and not self.transparent[block_id]
+
+    def get_faces(self, position):
+        # 返回 position 处方块的可见面掩码, 空气返回 0
+        x, y, z = position
+        if not MIN_HEIGHT <= y < MAX_HEIGHT:
+            return 0
+        chunk = self.chunks.get((x >> 4, z >> 4))
+        if chunk is None:
+            return 0
+        return chunk.get_faces(x, y, z)
+
+    def load_chunk(self, cx, cz, bottom, blocks):
+        """
+        用 NumPy 数组整体写入一个区块, 代替逐个方块调用 set_id, 用于地形生成.
+        区块原有的方块会被全部替换, 可见面掩码和高度图也一并用数组运算求出,
+        并同时更新相邻区块朝向这里的面.
+
+        :param: cx, cz 区块坐标
+        :param: bottom 数组最底层的 y 坐标, 必须是 16 的倍数
+        :param: blocks 形状为 (16 * n, 16, 16) 的 uint16 方块 ID 数组, 下标为 [y, z, x], 数组以外为空气
+        """
+        height = blocks.shape[0]
+        assert bottom % SECTOR_SIZE == 0 and height % SECTOR_SIZE == 0
+        assert MIN_HEIGHT <= bottom and bottom + height <= MAX_HEIGHT
+        opaque_table = np.array([self.is_opaque(i) for i in range(len(self.transparent))], dtype=bool)
+        opaque = opaque_table[blocks]
+        # 四周各多出一格的不透明度数组, 水平方向的边界取自相邻区块
+        padded = np.zeros((height + 2, SECTOR_SIZE + 2, SECTOR_SIZE + 2), dtype=bool)
+        padded[1:-1, 1:-1, 1:-1] = opaque
+        neighbors = dict()
+        for dx, dz in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            neighbor = self.chunks.get((cx + dx, cz + dz))
+            if neighbor is None:
+                continue
+            neighbors[(dx, dz)] = neighbor
+            plane = opaque_table[neighbor.get_blocks(bottom, height)]
+            if dx == -1:
+                padded[1:-1, 1:-1, 0] = plane[:, :, -1]
+            elif dx == 1:
+                padded[1:-1, 1:-1, -1] = plane[:, :, 0]
+            elif dz == -1:
+                padded[1:-1, 0, 1:-1] = plane[:, -1, :]
+            else:
+                padded[1:-1, -1, 1:-1] = plane[:, 0, :]
+        faces = np.zeros(blocks.shape, dtype=np.uint8)
+        for i, (dx, dy, dz) in enumerate(FACES):
+            hidden = padded[1 + dy: height + 1 + dy, 1 + dz: SECTOR_SIZE + 1 + dz, 1 + dx: SECTOR_SIZE + 1 + dx]
+            faces |= (~hidden).astype(np.uint8) << i
+        faces[blocks == 0] = 0
+        # 写入区段
+        chunk = Chunk(cx, cz)
+        for k in range(0, height, SECTOR_SIZE):
+            count = int(np.count_nonzero(blocks[k: k + SECTOR_SIZE]))
+            if count == 0:
+                continue
+            section = Section()
+            section.blocks = array('H', np.ascontiguousarray(blocks[k: k + SECTOR_SIZE]).tobytes())
+            section.faces = array('B', np.ascontiguousarray(faces[k: k + SECTOR_SIZE]).tobytes())
+            section.count = count
+            chunk.sections[(bottom + k - MIN_HEIGHT) >> 4] = section
+            chunk.count += count
+        # 高度图
+        occupied = blocks != 0
+        top = height - 1 - np.argmax(occupied[::-1], axis=0)
+        heightmap = np.where(occupied.any(axis=0), bottom + top, MIN_HEIGHT - 1)
+        chunk.heightmap = array('h', heightmap.astype(np.int16).tobytes())
+        if chunk.count:
+            self.chunks[(cx, cz)] = chunk
+        else:
+            self.chunks.pop((cx, cz), None)
+        # 相邻区块朝向这里的面
+        for (dx, dz), neighbor in neighbors.items():
+            if dx == -1:
+                face, ours, theirs = 3, opaque[:, :, 0], (slice(None), slice(None), -1)
+            elif dx == 1:
+                face, ours, theirs = 2, opaque[:, :, -1], (slice(None), slice(None), 0)
+            elif dz == -1:
+                face, ours, theirs = 4, opaque[:, 0, :], (slice(None), -1, slice(None))
+            else:
+                face, ours, theirs = 5, opaque[:, -1, :], (slice(None), 0, slice(None))
+            bit = np.uint8(1 << face)
+            for i, section in enumerate(neighbor.sections):
+                if section is None:
+                    continue
+                y = MIN_HEIGHT + i * SECTOR_SIZE
+                hidden = np.zeros((SECTOR_SIZE, SECTOR_SIZE), dtype=bool)
+                if bottom <= y < bottom + height:
+                    hidden = ours[y - bottom: y - bottom + SECTOR_SIZE]
+                view = section_view(section.faces, np.uint8)
+                plane = view[theirs]
+                exists = section_view(section.blocks, np.uint16)[theirs] != 0
+                view[theirs] = np.where(hidden, plane & ~bit, np.where(exists, plane | bit, plane))
+
+    def unload_chunk(self, cx, cz):
+        # 移除整个区块, 相邻区块朝向这里的面会重新变为可见
+        if (cx, cz) in self.chunks:
+            self.load_chunk(cx, cz, 0, np.zeros((SECTOR_SIZE, SECTOR_SIZE, SECTOR_SIZE), dtype=np.uint16))
+
+    def chunk_sectors(self, cx, cz):
+        # 返回区块中含有方块的区域
+        chunk = self.chunks.get((cx, cz))
+        if chunk is None:
+            return []
+        return [(cx, i + SECTION_OFFSET, cz) for i, section in enumerate(chunk.sections) if section is not None]
+
+    def chunk_memory(self, cx, cz):
+        # 估算区块占用的内存(字节)
+        chunk = self.chunks.get((cx, cz))
+        if chunk is None:
+            return 0
+        sections = len(chunk.sections) - chunk.sections.count(None)
+        return sections * SECTION_VOLUME * 3 + chunk.heightmap.itemsize * len(chunk.heightmap)
+
+    def _update_faces(self, x, y, z, old, new):
+        # 方块从 old 变为 new 后, 更新它自己和六个相邻方块的可见面掩码
+        opaque_changed = self.is_opaque(old) != self.is_opaque(new)
+        visible = not self.is_opaque(new)
+        faces = 0
+        for i, (dx, dy, dz) in enumerate(FACES):
+            nx, ny, nz = x + dx, y + dy, z + dz
+            neighbor = self.get_id((nx, ny, nz))
+            if not self.is_opaque(neighbor):
+                faces |= 1 << i
+            if neighbor != 0 and opaque_changed:
+                # 相邻方块朝向这里的面是 FACES[i ^ 1]
+                self.chunks[(nx >> 4, nz >> 4)].set_face(nx, ny, nz, i ^ 1, visible)
+        if new != 0:
+            self.chunks[(x >> 4, z >> 4)].set_faces(x, y, z, faces)
+
+    def get_height(self, x, z):
+        # 返回 x, z 列中最高方块的 y 坐标, 空列返回 MIN_HEIGHT - 1
+        chunk = self.chunks.get((x >> 4, z >> 4))
+        if chunk is None:
+            return MIN_HEIGHT - 1
+        return chunk.get_height(x, z)
+
+    def get_section(self, sector):
+        # 返回区域坐标 sector 对应的区段, 没有方块时返回 None
+        sx, sy, sz = sector
+        i = sy - SECTION_OFFSET
+        if not 0 <= i < SECTION_COUNT:
+            return None
+        chunk = self.chunks.get((sx, sz))
+        if chunk is None:
+            return None
+        return chunk.sections[i]
+
+    def sectors(self):
+        # 遍历所有含有方块的区域
+        for cx, cz in list(self.chunks.keys()):
+            yield from self.chunk_sectors(cx, cz)
+
+    def sector_positions(self, sector, exposed=False):
+        """
+        遍历区域内所有方块的坐标, 直接扫描区段数组
+
+        :param: sector 区域坐标
+        :param: exposed 为 True 时只遍历有可见面的方块
+        """
+        section = self.get_section(sector)
+        if section is None:
+            return
+        bx, by, bz = [i * SECTOR_SIZE for i in sector]
+        data = section.faces if exposed else section.blocks
+        for index in compress(range(SECTION_VOLUME), data):
+            yield (bx + (index & 15), by + (index >> 8), bz + ((index >> 4) & 15))
+
+    def random_positions(self, sector, count):
+        """
+        在区域内随机选取 count 个方块的坐标(可以重复), 只从非空气的方块中选取
+
+        :param: sector 区域坐标
+        :param: count 选取的数量
+        :return: 坐标的列表, 区域中没有方块时为空
+        """
+        section = self.get_section(sector)
+        if section is None:
+            return []
+        index = np.flatnonzero(np.frombuffer(section.blocks, dtype=np.uint16))
+        if not len(index):
+            return []
+        bx, by, bz = [i * SECTOR_SIZE for i in sector]
+        return [(bx + (i & 15), by + (i >> 8), bz + ((i >> 4) & 15))
+                for i in index[np.random.randint(len(index), size=count)].tolist()]
+
+    def get(self, position, default=None):
+        block_id = self.get_id(position)
+        if block_id == 0:
+            return default
+        return self.palette[block_id]
+
+    def __getitem__(self, position):
+        block_id = self.get_id(position)
+        if block_id == 0:
+            raise KeyError(position)
+        return self.palette[block_id]
+
+    def __setitem__(self, position, block):
+        self.set_id(position, block.id)
+
+    def __delitem__(self, position):
+        if self.set_id(position, 0) == 0:
+            raise KeyError(position)
+
+    def __contains__(self, position):
+        return self.get_id(position) != 0
+
+    def __len__(self):
+        return sum(chunk.count for chunk in self.chunks.values())
+
+    def __iter__(self):
+        for sector in list(self.sectors()):
+            yield from self.sector_positions(sector)
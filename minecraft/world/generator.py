@@ -0,0 +1,257 @@
+import os
+import shutil
+import zipfile
+
+from minecraft.utils.utils import *
+from minecraft.utils.leaf_shapes import LEAF_SHAPE
+from minecraft.world.chunk import MAX_HEIGHT
+
+import numpy as np
+from opensimplex import OpenSimplex
+
+# 生成器的版本, 改变生成结果时必须增加, 旧的区块缓存会自动失效
+GENERATOR_VERSION = 2
+# 树干的高度
+TREE_HEIGHT = 5
+# 树叶伸出树干的最大水平距离, 生成区块时要考虑这个范围内相邻区块的树木
+TREE_REACH = 2
+# 平坦世界的层预设, 可以在 level.json 的 layers 中用名称引用
+FLAT_PRESETS = {
+        'classic': [['bedrock', 1], ['dirt', 5], ['grass', 1]],
+        'desert': [['bedrock', 1], ['sand', 6]],
+        'tunnelers_dream': [['bedrock', 1], ['dirt', 40], ['grass', 1]]
+    }
+DEFAULT_FLAT_PRESET = 'classic'
+# 没有气候变化时的温度和湿度
+DEFAULT_CLIMATE = 0.8, 0.4
+
+
+class RandomGenerator(object):
+    """
+    随机世界的地形生成器, 以区块为单位用 NumPy 数组运算生成地形
+
+    :param: seed 种子
+    :param: ids 方块名称到方块 ID 的映射
+    """
+
+    def __init__(self, seed, ids):
+        self.simplex = OpenSimplex(seed=seed)
+        self.ids = ids
+
+    def get_height(self, xs, zs):
+        # 返回 xs, zs 列的地表高度, 下标为 [z, x]
+        return (self.simplex.noise2array(xs / 25, zs / 25) * 3 + SEA_LEVEL).astype(np.int64)
+
+    def get_trees(self, xs, zs):
+        # 返回 xs, zs 列是否生长树木, 下标为 [z, x]
+        noise = self.simplex.noise2array(xs, zs)
+        return ((0.511 < noise) & (noise < 0.512)) | ((0.301 < noise) & (noise < 0.302))
+
+    def get_climate(self, xs, zs):
+        """
+        返回 xs, zs 列的气候, 由低频噪声生成, 在 DEFAULT_CLIMATE 附近变化
+
+        :return: 形状为 (2, len(zs), len(xs)) 的 float32 数组, 分别为温度和湿度, 取值 0 到 1
+        """
+        temp = self.simplex.noise2array(xs / 256 + 1000, zs / 256) * 0.3 + DEFAULT_CLIMATE[0]
+        rainfall = self.simplex.noise2array(xs / 256, zs / 256 + 1000) * 0.4 + DEFAULT_CLIMATE[1]
+        return np.clip(np.stack((temp, rainfall)), 0, 1).astype(np.float32)
+
+    def get_columns(self, cx, cz, size, pad=0):
+        """
+        返回区块四周各扩展 pad 格范围内各列的信息
+
+        :param: cx, cz 区块坐标
+        :param: size 世界的大小, 为 None 时不限制
+        :param: pad 向四周扩展的格数
+        :return: (xs, zs, height, inside), 坐标, 地表高度以及是否在世界范围内, 后两者下标为 [z, x]
+        """
+        xs = np.arange(cx * SECTOR_SIZE - pad, (cx + 1) * SECTOR_SIZE + pad, dtype=np.float64)
+        zs = np.arange(cz * SECTOR_SIZE - pad, (cz + 1) * SECTOR_SIZE + pad, dtype=np.float64)
+        if size is None:
+            inside = np.ones((len(zs), len(xs)), dtype=bool)
+        else:
+            inside = (np.abs(zs)[:, None] <= size) & (np.abs(xs)[None, :] <= size)
+        return xs, zs, self.get_height(xs, zs), inside
+
+    def get_terrain(self, height, inside, top=1):
+        """
+        按地表高度生成一个区块的地形
+
+        :param: height, inside 区块内各列的地表高度和是否在世界范围内
+        :param: top 数组至少要包含的最高 y 坐标(不含)
+        :return: (bottom, blocks), 最底层的 y 坐标和下标为 [y, z, x] 的方块数组
+        """
+        bottom = min(0, int(height.min()) + 1) & ~(SECTOR_SIZE - 1)
+        top = max(top, int(height.max()) + 2)
+        top = (top + SECTOR_SIZE - 1) & ~(SECTOR_SIZE - 1)
+        ys = np.arange(bottom, top)[:, None, None]
+        blocks = np.where(ys == 0, self.ids['bedrock'], 0)
+        blocks = np.where((ys >= 1) & (ys <= height), self.ids['dirt'], blocks)
+        blocks = np.where(ys == height + 1, self.ids['grass'], blocks)
+        blocks[:, ~inside] = 0
+        return bottom, blocks.astype(np.uint16)
+
+    def place_trees(self, blocks, bottom, xs, zs, bases):
+        """
+        把树木写入区块的方块数组, 只写入落在区块内的部分.
+        树叶只填充空气, 树干覆盖其他方块, 因此结果与树木的放置顺序无关
+
+        :param: blocks, bottom 区块的方块数组及其最底层的 y 坐标
+        :param: xs, zs 树木相对区块的坐标, 可以在区块以外
+        :param: bases 树干最底部方块的 y 坐标
+        """
+        leaves = np.array(LEAF_SHAPE['oak_normal'])
+        lx = (xs[:, None] + leaves[:, 0]).ravel()
+        ly = (bases[:, None] + TREE_HEIGHT - 1 + leaves[:, 1]).ravel() - bottom
+        lz = (zs[:, None] + leaves[:, 2]).ravel()
+        keep = (lx >= 0) & (lx < SECTOR_SIZE) & (lz >= 0) & (lz < SECTOR_SIZE)
+        lx, ly, lz = lx[keep], ly[keep], lz[keep]
+        old = blocks[ly, lz, lx]
+        blocks[ly, lz, lx] = np.where(old == 0, self.ids['leaf'], old)
+        keep = (xs >= 0) & (xs < SECTOR_SIZE) & (zs >= 0) & (zs < SECTOR_SIZE)
+        ys = bases[keep][:, None] + np.arange(TREE_HEIGHT) - bottom
+        blocks[ys, zs[keep][:, None], xs[keep][:, None]] = self.ids['log']
+
+    def generate(self, cx, cz, size=None):
+        """
+        生成一个区块的地形和树木. 结果只取决于种子和区块坐标:
+        四周的树木由本区块重新计算, 只保留伸进本区块的树叶, 因此区块可以按任意顺序并行生成
+
+        :param: cx, cz 区块坐标
+        :param: size 世界的大小, 只生成 -size 到 size 之间的方块, 为 None 时不限制
+        :return: (bottom, blocks, climate), 可直接传给 ChunkStore.load_chunk 的最底层 y 坐标和方块数组,
+                 以及 get_climate 返回的区块内各列的气候
+        """
+        r = TREE_REACH
+        xs, zs, height, inside = self.get_columns(cx, cz, size, r)
+        tz, tx = np.nonzero(self.get_trees(xs, zs) & inside)
+        # 树干从草方块上面一格开始
+        bases = height[tz, tx] + 2
+        top = int(bases.max()) + TREE_HEIGHT + 1 if len(bases) else 1
+        bottom, blocks = self.get_terrain(height[r:-r, r:-r], inside[r:-r, r:-r], top)
+        self.place_trees(blocks, bottom, tx - r, tz - r, bases)
+        return bottom, blocks, self.get_climate(xs[r:-r], zs[r:-r])
+
+
+def valid_layers(layers):
+    # 自定义的层列表必须由 [方块名称, 层数] 组成, 总高度至少为 1 且不超过建筑限制
+    if not isinstance(layers, list):
+        return False
+    for layer in layers:
+        if not (isinstance(layer, (list, tuple)) and len(layer) == 2 and isinstance(layer[0], str)
+                and isinstance(layer[1], int) and not isinstance(layer[1], bool) and layer[1] >= 0):
+            return False
+    return 0 < sum(count for name, count in layers) <= MAX_HEIGHT
+
+
+class FlatGenerator(object):
+    """
+    平坦世界的生成器, 按层模板一次性填充整个区块
+
+    :param: layers 预设名称, 或者由下往上排列的 [方块名称, 层数] 列表, 最底层位于 y=0
+    :param: ids 方块名称到方块 ID 的映射
+    """
+
+    def __init__(self, layers, ids):
+        if isinstance(layers, str):
+            if layers not in FLAT_PRESETS:
+                log_warn("level.json: flat preset '%s' not found, use '%s'" % (layers, DEFAULT_FLAT_PRESET))
+                layers = DEFAULT_FLAT_PRESET
+            layers = FLAT_PRESETS[layers]
+        elif not valid_layers(layers):
+            log_warn("level.json: invalid flat layers, use '%s'" % DEFAULT_FLAT_PRESET)
+            layers = FLAT_PRESETS[DEFAULT_FLAT_PRESET]
+        column = [ids.get(name, ids['missing']) for name, count in layers for _ in range(count)]
+        height = (len(column) + SECTOR_SIZE - 1) & ~(SECTOR_SIZE - 1)
+        column = np.array(column + [0] * (height - len(column)), dtype=np.uint16)
+        # 所有区块共用的模板, ChunkStore.load_chunk 只读取它
+        self.template = np.broadcast_to(column[:, None, None], (height, SECTOR_SIZE, SECTOR_SIZE))
+        self.climate = np.empty((2, SECTOR_SIZE, SECTOR_SIZE), dtype=np.float32)
+        self.climate[0], self.climate[1] = DEFAULT_CLIMATE
+
+    def generate(self, cx, cz, size=None):
+        """
+        生成一个平坦区块
+
+        :param: cx, cz 区块坐标
+        :param: size 世界的大小, 只生成 -size 到 size 之间的方块, 为 None 时不限制
+        :return: (bottom, blocks, climate), 与 RandomGenerator.generate 相同, 气候处处相同
+        """
+        if size is not None:
+            xs = np.arange(cx * SECTOR_SIZE, (cx + 1) * SECTOR_SIZE)
+            zs = np.arange(cz * SECTOR_SIZE, (cz + 1) * SECTOR_SIZE)
+            inside = (np.abs(zs)[:, None] <= size) & (np.abs(xs)[None, :] <= size)
+            if not inside.all():
+                return 0, np.where(inside, self.template, 0).astype(np.uint16), self.climate
+        return 0, self.template, self.climate
+
+
+class ChunkCache(object):
+    """
+    存档中的区块缓存, 按 (种子, 生成器版本, 区块坐标) 保存随机世界的生成结果
+
+    :param: path 缓存所在的目录
+    :param: seed 种子
+    :param: size 世界的大小, 为 None 时表示无限世界
+    """
+
+    def __init__(self, path, seed, size=None):
+        self.root = path
+        self.path = os.path.join(path, 'v%d_%d_%s' % (GENERATOR_VERSION, seed, 'inf' if size is None else size))
+
+    def clean(self):
+        # 删除种子, 生成器版本或世界大小不同的旧缓存
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if os.path.join(self.root, name) != self.path:
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def load(self, cx, cz):
+        # 读取缓存的区块, 没有缓存或缓存损坏时返回 None
+        filename = os.path.join(self.path, '%d_%d.npz' % (cx, cz))
+        if not os.path.isfile(filename):
+            return None
+        try:
+            with np.load(filename) as data:
+                return int(data['bottom']), data['blocks'], data['climate']
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+    def save(self, cx, cz, bottom, blocks, climate):
+        # 保存区块, 先写入临时文件再替换, 避免留下不完整的缓存
+        os.makedirs(self.path, exist_ok=True)
+        filename = os.path.join(self.path, '%d_%d.npz' % (cx, cz))
+        temp = '%s.%d.tmp' % (filename, os.getpid())
+        try:
+            with open(temp, 'wb') as f:
+                np.savez(f, bottom=bottom, blocks=blocks, climate=climate)
+            os.replace(temp, filename)
+        except OSError as err:
+            log_warn('Cannot write chunk cache %s: %s' % (filename, err))
+
+
+# 工作进程中按种子缓存的生成器, 避免每个区块都重新初始化噪声
+_generators = {}
+
+def generate_chunk(seed, ids, cx, cz, size=None, cache=None):
+    """
+    生成一个区块, 在进程池的工作进程中调用时参数和返回值都可以被 pickle
+
+    :param: seed 种子
+    :param: ids 方块名称到方块 ID 的映射
+    :param: cx, cz 区块坐标
+    :param: size 世界的大小, 为 None 时不限制
+    :param: cache ChunkCache, 有缓存时直接读取, 否则生成后写入缓存
+    :return: 与 RandomGenerator.generate 相同
+    """
+    if cache is not None:
+        result = cache.load(cx, cz)
+        if result is not None:
+            return result
+    if seed not in _generators:
+        _generators[seed] = RandomGenerator(seed, ids)
+    result = _generators[seed].generate(cx, cz, size)
+    if cache is not None:
+        cache.save(cx, cz, *result)
+    return result
@@ -0,0 +1,329 @@
+from collections import deque
+
+from minecraft.utils.utils import *
+from minecraft.world.chunk import MIN_HEIGHT, MAX_HEIGHT, SECTION_COUNT, SECTION_OFFSET, SECTION_VOLUME
+
+import numpy as np
+
+# 最大光照等级, 露天处的天空光照
+MAX_LIGHT = 15
+# 两种光照: 天空光照和方块光照
+SKY, BLOCK = 0, 1
+# 一次改变的方块超过这个数量时, 不再增量更新, 而是重新计算周围区块的光照
+RELIGHT_LIMIT = 512
+
+
+class LightChunk(object):
+    # 一个区块的光照, 每个区段的天空光照和方块光照各用一个 4096 字节的数组保存, 下标与 Section 相同.
+    # 只保存第 bottom 到 top(不含)个区段, 更高处为露天, 更低处为黑暗, 传播到那里时才分配内存
+    __slots__ = ('bottom', 'top', 'levels')
+
+    def __init__(self, bottom, top):
+        self.bottom, self.top = bottom, top
+        self.levels = ([None] * SECTION_COUNT, [None] * SECTION_COUNT)
+
+    def get(self, channel, x, y, z):
+        # 返回世界坐标 x, y, z 处 channel 的光照等级
+        i = (y - MIN_HEIGHT) >> 4
+        data = self.levels[channel][i]
+        if data is None:
+            return MAX_LIGHT if channel == SKY and i >= self.top else 0
+        return data[((y & 15) << 8) | ((z & 15) << 4) | (x & 15)]
+
+    def set(self, channel, x, y, z, level):
+        # 设置世界坐标 x, y, z 处 channel 的光照等级
+        i = (y - MIN_HEIGHT) >> 4
+        if not self.bottom <= i < self.top:
+            self.extend(i)
+        self.levels[channel][i][((y & 15) << 8) | ((z & 15) << 4) | (x & 15)] = level
+
+    def extend(self, i):
+        # 把保存的范围扩展到第 i 个区段, 新的区段按原来的隐含值填充
+        for k in list(range(self.top, i + 1)) + list(range(i, self.bottom)):
+            self.levels[SKY][k] = bytearray([MAX_LIGHT if k >= self.top else 0]) * SECTION_VOLUME
+            self.levels[BLOCK][k] = bytearray(SECTION_VOLUME)
+        self.bottom, self.top = min(self.bottom, i), max(self.top, i + 1)
+
+    def get_levels(self, channel, lo, hi):
+        # 以 NumPy 数组返回第 lo 到 hi(不含)个区段 channel 的光照, 下标为 [y, z, x]
+        result = np.empty(((hi - lo) * SECTOR_SIZE, SECTOR_SIZE, SECTOR_SIZE), dtype=np.uint8)
+        for i in range(lo, hi):
+            data = self.levels[channel][i]
+            k = (i - lo) * SECTOR_SIZE
+            if data is None:
+                result[k: k + SECTOR_SIZE] = MAX_LIGHT if channel == SKY and i >= self.top else 0
+            else:
+                result[k: k + SECTOR_SIZE] = np.frombuffer(data, dtype=np.uint8).reshape(
+                        (SECTOR_SIZE, SECTOR_SIZE, SECTOR_SIZE))
+        return result
+
+    def memory(self):
+        # 估算光照占用的内存(字节)
+        return sum(SECTION_VOLUME for data in self.levels[SKY] + self.levels[BLOCK] if data is not None)
+
+
+class LightEngine(object):
+    """
+    按区块保存天空光照和方块光照, 用广度优先搜索(BFS)传播.
+
+    光照每经过一格减少 1, 不透明方块阻挡光照; 天空光照在没有遮挡时向下传播不会减少.
+    区块载入时用 NumPy 数组运算整体求出光照, 方块改变时只重新计算受影响的范围:
+    先沿着原来的光照清除可能由改变的方块照亮的格子, 再从清除范围的边界和新的光源重新传播.
+    没有载入的区块视为黑暗, 光照不会传播进去
+
+    :param: store ChunkStore
+    :param: luminance 以方块 ID 为下标的方块发光等级列表
+    """
+
+    def __init__(self, store, luminance):
+        self.store = store
+        self.luminance = luminance
+        self.opaque = [store.is_opaque(i) for i in range(len(luminance))]
+        self.chunks = {}
+
+    def get(self, position):
+        # 返回 position 处的光照等级, 即天空光照和方块光照中较大的一个
+        return max(self.get_level(SKY, position), self.get_level(BLOCK, position))
+
+    def get_level(self, channel, position):
+        # 返回 position 处 channel 的光照等级, 超出建筑限制或区块没有载入时视为露天或黑暗
+        x, y, z = position
+        if y >= MAX_HEIGHT:
+            return MAX_LIGHT if channel == SKY else 0
+        chunk = self.chunks.get((x >> 4, z >> 4))
+        if chunk is None or y < MIN_HEIGHT:
+            return 0
+        return chunk.get(channel, x, y, z)
+
+    def load_chunk(self, cx, cz):
+        """
+        按区块存储中的方块整体计算一个区块的光照, 边界上取相邻区块的光照,
+        再把光照传播到相邻区块中
+
+        :param: cx, cz 区块坐标
+        :return: 相邻区块中光照改变了的坐标的集合
+        """
+        chunk = self.store.chunks.get((cx, cz))
+        indices = [i for i, section in enumerate(chunk.sections) if section is not None] if chunk else []
+        if not indices:
+            # 空区块处处露天
+            self.chunks[(cx, cz)] = LightChunk(0, 0)
+            return self._spread_border(cx, cz)
+        # 多保存一个区段, 最高处的光源向上传播时不必再扩展
+        lo, hi = indices[0], min(indices[-1] + 2, SECTION_COUNT)
+        light = LightChunk(lo, hi)
+        bottom, height = MIN_HEIGHT + lo * SECTOR_SIZE, (hi - lo) * SECTOR_SIZE
+        blocks = chunk.get_blocks(bottom, height)
+        opaque = np.array(self.opaque, dtype=bool)[blocks]
+        # 直接照到天空的格子: 它和上方都没有不透明方块
+        sky = ~np.logical_or.accumulate(opaque[::-1], axis=0)[::-1]
+        initial = (np.where(sky, MAX_LIGHT, 0), np.array(self.luminance, dtype=np.uint8)[blocks])
+        for channel in (SKY, BLOCK):
+            levels = self._flood(cx, cz, channel, initial[channel].astype(np.int16), opaque, lo, hi)
+            for k in range(lo, hi):
+                light.levels[channel][k] = bytearray(levels[(k - lo) * SECTOR_SIZE: (k - lo + 1) * SECTOR_SIZE].tobytes())
+        self.chunks[(cx, cz)] = light
+        return self._spread_border(cx, cz)
+
+    def unload_chunk(self, cx, cz):
+        # 移除区块的光照, 相邻区块中由它照亮的部分保持不变, 区块重新载入时会重新计算
+        self.chunks.pop((cx, cz), None)
+
+    def chunk_memory(self, cx, cz):
+        # 估算区块的光照占用的内存(字节)
+        light = self.chunks.get((cx, cz))
+        return light.memory() if light is not None else 0
+
+    def _flood(self, cx, cz, channel, levels, opaque, lo, hi):
+        # 在区块内反复向相邻的格子传播光照, 直到不再改变, 边界上的光照取自相邻区块
+        height = levels.shape[0]
+        padded = np.zeros((height + 2, SECTOR_SIZE + 2, SECTOR_SIZE + 2), dtype=np.int16)
+        padded[1:-1, 1:-1, 1:-1] = levels
+        if channel == SKY:
+            padded[-1] = MAX_LIGHT
+        for dx, dz in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            neighbor = self.chunks.get((cx + dx, cz + dz))
+            if neighbor is None:
+                continue
+            plane = neighbor.get_levels(channel, lo, hi)
+            if dx == -1:
+                padded[1:-1, 1:-1, 0] = plane[:, :, -1]
+            elif dx == 1:
+                padded[1:-1, 1:-1, -1] = plane[:, :, 0]
+            elif dz == -1:
+                padded[1:-1, 0, 1:-1] = plane[:, -1, :]
+            else:
+                padded[1:-1, -1, 1:-1] = plane[:, 0, :]
+        inner = padded[1:-1, 1:-1, 1:-1]
+        # 光照最多传播 MAX_LIGHT 格
+        for _ in range(MAX_LIGHT):
+            above = padded[2:, 1:-1, 1:-1]
+            spread = np.maximum.reduce([above, padded[:-2, 1:-1, 1:-1], padded[1:-1, :-2, 1:-1],
+                    padded[1:-1, 2:, 1:-1], padded[1:-1, 1:-1, :-2], padded[1:-1, 1:-1, 2:]]) - 1
+            if channel == SKY:
+                spread = np.where(above == MAX_LIGHT, MAX_LIGHT, spread)
+            result = np.where(opaque, inner, np.maximum(inner, spread))
+            if (result == inner).all():
+                break
+            inner[...] = result
+        return inner.astype(np.uint8)
+
+    def _spread_border(self, cx, cz):
+        # 从区块边界上比相邻区块亮的格子开始, 把光照传播到已载入的相邻区块中
+        light = self.chunks[(cx, cz)]
+        x0, z0 = cx * SECTOR_SIZE, cz * SECTOR_SIZE
+        changed = set()
+        for channel in (SKY, BLOCK):
+            queue = deque()
+            for dx, dz in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                neighbor = self.chunks.get((cx + dx, cz + dz))
+                if neighbor is None:
+                    continue
+                # 两个区块都没有保存的高度上双方都是露天, 不用比较
+                ranges = [(c.bottom, c.top) for c in (light, neighbor) if c.bottom < c.top]
+                if not ranges:
+                    continue
+                lo, hi = min(r[0] for r in ranges), max(r[1] for r in ranges)
+                ours, theirs = light.get_levels(channel, lo, hi), neighbor.get_levels(channel, lo, hi)
+                if dx == -1:
+                    ours, theirs, fixed = ours[:, :, 0], theirs[:, :, -1], (None, 0)
+                elif dx == 1:
+                    ours, theirs, fixed = ours[:, :, -1], theirs[:, :, 0], (None, SECTOR_SIZE - 1)
+                elif dz == -1:
+                    ours, theirs, fixed = ours[:, 0, :], theirs[:, -1, :], (0, None)
+                else:
+                    ours, theirs, fixed = ours[:, -1, :], theirs[:, 0, :], (SECTOR_SIZE - 1, None)
+                for y, k in zip(*np.nonzero(ours.astype(np.int16) - 1 > theirs)):
+                    z, x = (fixed[0], k) if fixed[1] is None else (k, fixed[1])
+                    queue.append((x0 + int(x), MIN_HEIGHT + lo * SECTOR_SIZE + int(y), z0 + int(z)))
+            self._increase(channel, queue, changed)
+        return changed
+
+    def update(self, positions):
+        """
+        方块改变后增量更新光照, 只重新计算受影响的范围.
+        增量更新的耗时与光照改变的格子数成正比, 挖开地表时天空光照会照进整个空洞,
+        一次改变几百个方块(例如 TNT 爆炸或大范围填充)时比重新计算 3x3 个区块还慢,
+        因此改变的方块超过 RELIGHT_LIMIT 个时改用 _relight
+
+        :param: positions 方块改变了的坐标
+        :return: 光照改变了的坐标的集合
+        """
+        if len(positions) > RELIGHT_LIMIT:
+            return self._relight(positions)
+        changed = set()
+        for channel in (SKY, BLOCK):
+            decrease, increase, seeds = deque(), deque(), set()
+            for position in positions:
+                x, y, z = position
+                chunk = self.chunks.get((x >> 4, z >> 4))
+                if chunk is None or not MIN_HEIGHT <= y < MAX_HEIGHT:
+                    continue
+                level = chunk.get(channel, x, y, z)
+                if level:
+                    chunk.set(channel, x, y, z, 0)
+                    changed.add(position)
+                    decrease.append((position, level))
+                block_id = self.store.get_id(position)
+                if channel == BLOCK and self.luminance[block_id]:
+                    chunk.set(channel, x, y, z, self.luminance[block_id])
+                    changed.add(position)
+                    increase.append(position)
+                if not self.opaque[block_id]:
+                    # 变得透明的方块由相邻的格子重新照亮
+                    seeds.update((x + dx, y + dy, z + dz) for dx, dy, dz in FACES)
+            increase.extend(seeds)
+            self._decrease(channel, decrease, increase, changed)
+            self._increase(channel, increase, changed)
+        return changed
+
+    def _relight(self, positions):
+        # 重新计算 positions 所在区块及其四周区块的光照, 返回光照改变了的坐标的集合.
+        # 光照最多传播 MAX_LIGHT 格, 更远的区块不受这些方块影响, 可以作为边界
+        chunks = sorted(set(((x >> 4) + dx, (z >> 4) + dz) for x, y, z in positions
+                for dx in (-1, 0, 1) for dz in (-1, 0, 1)) & self.chunks.keys())
+        old = dict((chunk, self.chunks.pop(chunk)) for chunk in chunks)
+        changed = set()
+        for cx, cz in chunks:
+            changed.update(self.load_chunk(cx, cz))
+        for (cx, cz), light in old.items():
+            new = self.chunks[(cx, cz)]
+            lo, hi = min(light.bottom, new.bottom), max(light.top, new.top)
+            if lo >= hi:
+                continue
+            for channel in (SKY, BLOCK):
+                y, z, x = np.nonzero(light.get_levels(channel, lo, hi) != new.get_levels(channel, lo, hi))
+                changed.update(zip((x + cx * SECTOR_SIZE).tolist(), (y + MIN_HEIGHT + lo * SECTOR_SIZE).tolist(),
+                        (z + cz * SECTOR_SIZE).tolist()))
+        return changed
+
+    def _decrease(self, channel, queue, increase, changed):
+        # 清除可能由 queue 中的格子照亮的格子, 遇到由别处照亮的格子时把它加入 increase 重新传播
+        while queue:
+            (x, y, z), level = queue.popleft()
+            for dx, dy, dz in FACES:
+                position = (x + dx, y + dy, z + dz)
+                neighbor = self.get_level(channel, position)
+                if neighbor == 0:
+                    continue
+                if neighbor < level or channel == SKY and dy == -1 and level == MAX_LIGHT:
+                    if not MIN_HEIGHT <= position[1] < MAX_HEIGHT:
+                        continue
+                    self.chunks[(position[0] >> 4, position[2] >> 4)].set(channel, *position, 0)
+                    changed.add(position)
+                    queue.append((position, neighbor))
+                    luminance = self.luminance[self.store.get_id(position)] if channel == BLOCK else 0
+                    if luminance:
+                        # 被清除的光源重新发光
+                        self.chunks[(position[0] >> 4, position[2] >> 4)].set(channel, *position, luminance)
+                        increase.append(position)
+                else:
+                    increase.append(position)
+
+    def _increase(self, channel, queue, changed):
+        # 从 queue 中的格子开始向四周传播光照
+        while queue:
+            x, y, z = queue.popleft()
+            level = self.get_level(channel, (x, y, z))
+            if level <= 1:
+                continue
+            for dx, dy, dz in FACES:
+                position = (x + dx, y + dy, z + dz)
+                if not MIN_HEIGHT <= position[1] < MAX_HEIGHT:
+                    continue
+                chunk = self.chunks.get((position[0] >> 4, position[2] >> 4))
+                if chunk is None:
+                    continue
+                new = level if channel == SKY and dy == -1 and level == MAX_LIGHT else level - 1
+                if chunk.get(channel, *position) < new and not self.opaque[self.store.get_id(position)]:
+                    chunk.set(channel, *position, new)
+                    changed.add(position)
+                    queue.append(position)
+
+    def get_region(self, sector):
+        """
+        返回区域及其四周各一格的光照, 用于生成网格
+
+        :param: sector 区域坐标
+        :return: 形状为 (2, 18, 18, 18) 的 uint8 数组, 分别为天空光照和方块光照, 下标为 [y, z, x],
+                 第 1 到 16 个为区域内的格子. 尚未载入的区块按露天处理, 避免已载入范围的边缘变暗
+        """
+        sx, sy, sz = sector
+        i = sy - SECTION_OFFSET
+        lo, hi = max(i - 1, 0), min(i + 2, SECTION_COUNT)
+        region = np.zeros((2, 3 * SECTOR_SIZE, 3 * SECTOR_SIZE, 3 * SECTOR_SIZE), dtype=np.uint8)
+        if i + 2 > SECTION_COUNT:
+            region[SKY, 2 * SECTOR_SIZE:] = MAX_LIGHT
+        for dx in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                light = self.chunks.get((sx + dx, sz + dz))
+                columns = region[:, :, (dz + 1) * SECTOR_SIZE: (dz + 2) * SECTOR_SIZE,
+                        (dx + 1) * SECTOR_SIZE: (dx + 2) * SECTOR_SIZE]
+                if light is None:
+                    columns[SKY] = MAX_LIGHT
+                    continue
+                y = (lo - i + 1) * SECTOR_SIZE
+                for channel in (SKY, BLOCK):
+                    columns[channel, y: y + (hi - lo) * SECTOR_SIZE] = light.get_levels(channel, lo, hi)
+        return region[:, SECTOR_SIZE - 1: 2 * SECTOR_SIZE + 1, SECTOR_SIZE - 1: 2 * SECTOR_SIZE + 1,
+                SECTOR_SIZE - 1: 2 * SECTOR_SIZE + 1]
@@ -0,0 +1,242 @@
+from minecraft.utils.utils import *
+from minecraft.world.chunk import MIN_HEIGHT, section_view
+
+import numpy as np
+
+# 立方体每个面四个顶点相对方块中心的偏移, 顺序与 cube_vertices 相同
+FACE_CORNERS = [[tuple(cube_vertices(0, 0, 0, 1, 1)[i * 12 + k * 3: i * 12 + k * 3 + 3]) for k in range(4)]
+        for i in range(6)]
+# 每个面四个顶点的纹理坐标, 与 BlockTextureGroup 中贴图的顺序相同
+FACE_UVS = [(0, 0), (1, 0), (1, 1), (0, 1)]
+# 每个面指向的相邻格子的偏移, 面的光照取自这一格
+FACE_OFFSETS = np.array(FACES)
+# 每个面四个顶点在光照贴图上的纹理坐标, 下标为 [天空光照, 方块光照], 取对应像素的中心
+LIGHT_COORDS = np.array([[[(sky + 0.5) / 16, (block + 0.5) / 16] * 4 for block in range(16)]
+        for sky in range(16)], dtype=np.float32)
+# 露天处的光照贴图坐标, 用于不保存光照的低精度网格
+FULL_LIGHT = LIGHT_COORDS[15, 0].tolist()
+
+
+def cull_faces(store, position, block_id, faces):
+    """
+    在可见面掩码的基础上, 去掉透明方块与相同方块相邻的面, 例如连在一起的玻璃之间的面.
+    可见面掩码只保证与不透明方块相邻的面已经去掉
+
+    :param: store ChunkStore
+    :param: position 方块坐标
+    :param: block_id 方块 ID, 必须是透明方块
+    :param: faces 可见面掩码
+    """
+    x, y, z = position
+    for i, (dx, dy, dz) in enumerate(FACES):
+        if faces & (1 << i) and store.get_id((x + dx, y + dy, z + dz)) == block_id:
+            faces &= ~(1 << i)
+    return faces
+
+def build_sector_mesh(store, sector, get_tint, get_light=None):
+    """
+    为一个区域生成网格, 区域中同一贴图组、同一渲染层的方块合并为一个顶点列表.
+    只生成与空气或其他透明方块相邻的面.
+    每种方块只调用一次 get_vertices(0, 0, 0) 作为六个面的顶点模板, 再用 NumPy 一次平移到所有方块的位置,
+    因此要求方块的形状与位置无关.
+    每个面朝向的格子的天空光照和方块光照保存为光照贴图的纹理坐标, 昼夜变化只需改变光照贴图, 不用重新生成网格
+
+    :param: store ChunkStore
+    :param: sector 区域坐标
+    :param: get_tint 函数, 参数为 (坐标, 色图), 返回该列方块的颜色
+    :param: get_light 函数, 参数为区域坐标, 返回 LightEngine.get_region 的结果, 为 None 时全部为露天
+    :return: 字典, 键为 (是否透明, 贴图组), 值为 (顶点数, 顶点坐标, 纹理坐标, 颜色, 光照贴图坐标),
+             后四者为 float32 数组
+    """
+    section = store.get_section(sector)
+    if section is None:
+        return dict()
+    masks = np.frombuffer(section.faces, dtype=np.uint8)
+    index = np.flatnonzero(masks)
+    ids = np.frombuffer(section.blocks, dtype=np.uint16)[index]
+    masks = masks[index]
+    local = np.stack((index & 15, index >> 8, (index >> 4) & 15), axis=1)
+    positions = local + np.array(sector) * SECTOR_SIZE
+    region = get_light(sector) if get_light is not None else None
+    parts = dict()
+    for block_id in np.unique(ids).tolist():
+        block = store.palette[block_id]
+        cells = ids == block_id
+        block_positions, block_local, block_masks = positions[cells], local[cells], masks[cells]
+        if block.transparent:
+            block_masks = np.array([cull_faces(store, tuple(position), block_id, faces) for position, faces
+                    in zip(block_positions.tolist(), block_masks.tolist())], dtype=np.uint8)
+        # 每个可见面对应一个 (方块, 面) 对, 按方块和 FACES 的顺序排列
+        cell, face = np.nonzero((block_masks[:, None] >> np.arange(6, dtype=np.uint8)) & 1)
+        if not len(cell):
+            continue
+        vertices = np.array(block.get_vertices(0, 0, 0), dtype=np.float32).reshape(6, 4, 3)
+        vertices = vertices[face] + block_positions[cell][:, None, :]
+        tex_coords = np.array(block.texture_data, dtype=np.float32).reshape(6, 8)[face]
+        if hasattr(block, 'get_tinted_color'):
+            # 同一列的方块颜色相同, 每一列只求一次
+            columns, inverse = np.unique(block_positions[:, [0, 2]], axis=0, return_inverse=True)
+            tinted = dict()
+            table = []
+            for x, z in columns.tolist():
+                tint = get_tint((x, 0, z), block.colorizer)
+                if tint not in tinted:
+                    tinted[tint] = block.get_tinted_color(tint, 16)
+                table.append(tinted[tint])
+            table = np.array(table, dtype=np.float32).reshape(-1, 6, 12)
+            colors = table[inverse.reshape(-1)[cell], face]
+        else:
+            colors = np.broadcast_to(np.array(get_color_by_brightness(16) * 4, dtype=np.float32), (len(cell), 12))
+        if region is None:
+            light = np.broadcast_to(LIGHT_COORDS[15, 0], (len(cell), 8))
+        else:
+            neighbors = block_local[cell] + FACE_OFFSETS[face] + 1
+            light = LIGHT_COORDS[region[0, neighbors[:, 1], neighbors[:, 2], neighbors[:, 0]],
+                    region[1, neighbors[:, 1], neighbors[:, 2], neighbors[:, 0]]]
+        parts.setdefault((block.transparent, block.group), []).append((vertices, tex_coords, colors, light))
+    mesh = dict()
+    for key, arrays in parts.items():
+        # 先求出总面数, 再把各种方块的数据写入预先分配的数组
+        count = sum(len(part[0]) for part in arrays)
+        data = [np.empty((count, 12), dtype=np.float32), np.empty((count, 8), dtype=np.float32),
+                np.empty((count, 12), dtype=np.float32), np.empty((count, 8), dtype=np.float32)]
+        start = 0
+        for part in arrays:
+            end = start + len(part[0])
+            for buffer, array in zip(data, part):
+                buffer[start: end] = array.reshape(end - start, -1)
+            start = end
+        mesh[key] = [count * 4] + [buffer.reshape(-1) for buffer in data]
+    return mesh
+
+def build_chunk_lod(store, cx, cz, get_tint):
+    """
+    为远处的区块生成低精度网格: 每一列只绘制最高方块的顶面, 以及比相邻列高出的侧面,
+    侧面的贴图拉伸到整个高度差. 相邻列没有方块或尚未生成时不绘制侧面
+
+    :param: store ChunkStore
+    :param: cx, cz 区块坐标
+    :param: get_tint 函数, 参数为 (坐标, 色图), 返回该列方块的颜色
+    :return: 与 build_sector_mesh 相同, 远处不计算光照, 都按露天绘制
+    """
+    mesh = dict()
+    chunk = store.chunks.get((cx, cz))
+    if chunk is None:
+        return mesh
+    for index, height in enumerate(chunk.heightmap):
+        if height < MIN_HEIGHT:
+            continue
+        position = (cx * SECTOR_SIZE + (index & 15), height, cz * SECTOR_SIZE + (index >> 4))
+        block = store[position]
+        if hasattr(block, 'get_tinted_color'):
+            color = block.get_tinted_color(get_tint(position, block.colorizer), 16)
+        else:
+            color = get_color_by_brightness(16) * 24
+        key = (block.transparent, block.group)
+        if key not in mesh:
+            mesh[key] = [0, [], [], [], []]
+        data = mesh[key]
+        x, y, z = position
+        for i, (dx, dy, dz) in enumerate(FACES):
+            if dy < 0:
+                continue
+            low = y
+            if dy == 0:
+                low = store.get_height(x + dx, z + dz)
+                if low < MIN_HEIGHT or low >= y:
+                    continue
+            data[0] += 4
+            for corner in FACE_CORNERS[i]:
+                data[1].extend((x + corner[0], (y if corner[1] > 0 else low) + 0.5, z + corner[2]))
+            data[2].extend(block.texture_data[i * 8: i * 8 + 8])
+            data[3].extend(color[i * 12: i * 12 + 12])
+            data[4].extend(FULL_LIGHT)
+    return dict((key, data) for key, data in mesh.items() if data[0])
+
+def pack_mesh(mesh):
+    """
+    把网格的顶点数据转换为 float32 数组, 主线程上传时只需按列整块复制
+
+    :param: mesh build_sector_mesh 或 build_sector_mesh_greedy 的返回值
+    :return: 字典, 键与 mesh 相同, 值为 (顶点数, 顶点坐标, 纹理坐标, 颜色, 光照贴图坐标), 后四者为 NumPy 数组
+    """
+    return dict((key, (data[0],) + tuple(np.asarray(array, dtype=np.float32) for array in data[1:]))
+            for key, data in mesh.items())
+
+def build_sector_mesh_greedy(store, sector, get_tint, get_light=None):
+    """
+    贪婪网格: 把同一平面上相邻、贴图、颜色和光照都相同的面合并成一个大的四边形.
+    合并后的面使用 RepeatTextureGroup 平铺贴图, 参数和返回值与 build_sector_mesh 相同
+    """
+    mesh = dict()
+    section = store.get_section(sector)
+    if section is None:
+        return mesh
+    origin = [i * SECTOR_SIZE for i in sector]
+    region = get_light(sector) if get_light is not None else None
+    ids = section_view(section.blocks, np.uint16)
+    masks = section_view(section.faces, np.uint8)
+    colors = dict()
+    for i, direction in enumerate(FACES):
+        # 法线所在的轴和面内的两个轴, 0, 1, 2 分别为 x, y, z
+        n = [abs(d) for d in direction].index(1)
+        a, b = [axis for axis in range(3) if axis != n]
+        layers = dict()
+        for y, z, x in zip(*np.nonzero(masks & (1 << i))):
+            local = (int(x), int(y), int(z))
+            position = tuple(o + p for o, p in zip(origin, local))
+            block_id = int(ids[y, z, x])
+            block = store.palette[block_id]
+            if block.transparent and not cull_faces(store, position, block_id, 1 << i):
+                continue
+            if region is None:
+                light = (15, 0)
+            else:
+                light = tuple(region[:, y + 1 + direction[1], z + 1 + direction[2], x + 1 + direction[0]].tolist())
+            if hasattr(block, 'get_tinted_color'):
+                tint = get_tint(position, block.colorizer)
+                if (block_id, tint) not in colors:
+                    colors[(block_id, tint)] = block.get_tinted_color(tint, 16)
+                color = tuple(colors[(block_id, tint)][i * 12: i * 12 + 3])
+            else:
+                color = tuple(get_color_by_brightness(16))
+            key = (block.transparent, block.face_groups[i], color, light)
+            layers.setdefault(local[n], dict())[(local[a], local[b])] = key
+        for c, cells in layers.items():
+            done = set()
+            for pa, pb in sorted(cells, key=lambda p: (p[1], p[0])):
+                if (pa, pb) in done:
+                    continue
+                key = cells[(pa, pb)]
+                match = lambda p: p not in done and cells.get(p) == key
+                w = 1
+                while match((pa + w, pb)):
+                    w += 1
+                h = 1
+                while all(match((pa + k, pb + h)) for k in range(w)):
+                    h += 1
+                done.update((pa + k, pb + j) for k in range(w) for j in range(h))
+                _add_quad(mesh, key, i, n, a, b, origin, c, pa, pb, w, h)
+    return mesh
+
+def _add_quad(mesh, key, face, n, a, b, origin, c, pa, pb, w, h):
+    # 添加一个覆盖 w x h 个方块面的四边形, 纹理坐标按大小平铺
+    transparent, group, color, light = key
+    corners = FACE_CORNERS[face]
+    size = {a: w, b: h}
+    # 纹理的 u 方向是第 0, 1 个顶点之间变化的轴, v 方向是第 1, 2 个顶点之间变化的轴
+    u_axis = [k for k in range(3) if corners[0][k] != corners[1][k]][0]
+    v_axis = [k for k in range(3) if corners[1][k] != corners[2][k]][0]
+    if (transparent, group) not in mesh:
+        mesh[(transparent, group)] = [0, [], [], [], []]
+    data = mesh[(transparent, group)]
+    data[0] += 4
+    for corner, (u, v) in zip(corners, FACE_UVS):
+        vertex = [0, 0, 0]
+        vertex[n] = origin[n] + c + corner[n]
+        vertex[a] = origin[a] + pa - 0.5 + (w if corner[a] > 0 else 0)
+        vertex[b] = origin[b] + pb - 0.5 + (h if corner[b] > 0 else 0)
+        data[1].extend(vertex)
+        data[2].extend((u * size[u_axis], v * size[v_axis]))
+        data[3].extend(color)
+        data[4].extend(LIGHT_COORDS[light][:2].tolist())
@@ -61,7 +61,9 @@ class Rain(Weather):
                     min(128, py + 20),
                     pz + random.randint(-16, 16) + random.random()))
         for drop in self._drops:
-            if (get_game().world.get(normalize(drop['pos'])) is not None) or (drop['pos'][2] < 0):
+            x, y, z = normalize(drop['pos'])
+            if drop['pos'][1] < get_game().world.get_highest_block(x, z) + 0.5:
+                # 雨滴落到了这一列最高的方块上
                 drop['shown'] = False
             else:
                 drop['pos'] = drop['pos'][0], drop['pos'][1] - dt * 5, drop['pos'][2]
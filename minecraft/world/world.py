@@ -1,16 +1,19 @@
-from collections import deque
-import math
-import os
-import random
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import ctypes
 import time
 
 import minecraft.saves as saves
-from minecraft.source import resource_pack
-from minecraft.block import blocks
+from minecraft.source import resource_pack, settings
+from minecraft.block import block_ids, block_list, block_luminance, block_transparent, get_block_id
 from minecraft.utils.utils import *
-from minecraft.utils.leaf_shapes import LEAF_SHAPE
+from minecraft.utils.opengl import boxes_in_frustum, disable_lightmap, enable_lightmap, get_frustum, sectors_in_frustum
+from minecraft.world.chunk import ChunkStore, MAX_HEIGHT, MIN_HEIGHT
+from minecraft.world.light import LightEngine
+from minecraft.world.mesh import build_chunk_lod, build_sector_mesh, build_sector_mesh_greedy, pack_mesh
+from minecraft.world.generator import DEFAULT_CLIMATE, DEFAULT_FLAT_PRESET, ChunkCache, FlatGenerator, RandomGenerator, generate_chunk
 
-from opensimplex import OpenSimplex
+import numpy as np
 import pyglet
 from pyglet.gl import *
 
@@ -25,66 +28,274 @@ class World(object):
         self.batch2d = pyglet.graphics.Batch()
         # 存档名
         self.name = name
+        level = saves.load_level(name)
         # 种子
-        self.seed = saves.load_level(name)['seed']
-        # Simplex 噪声函数
-        self.simplex = OpenSimplex(seed=self.seed)
-        # world 存储着世界上所有的方块
-        self.world = {}
-        # 类似于 world, 但它只存储要显示的方块
-        self.shown = {}
+        self.seed = level['seed']
+        # 无限世界只在区块进入视野时才生成, 旧存档没有该项, 仍为预先生成的 MAX_SIZE 世界
+        self.infinite = level.get('infinite', False) and level['type'] != 'flat'
+        if level['type'] == 'flat':
+            # 平坦世界的层模板, 可以是预设名称或者自定义的层列表
+            self.generator = FlatGenerator(level.get('layers', DEFAULT_FLAT_PRESET), block_ids)
+            self.cache = None
+        else:
+            self.generator = RandomGenerator(self.seed, block_ids)
+            # 随机世界生成的区块缓存在存档中, 再次打开时不用重新计算噪声
+            self.cache = ChunkCache(saves.get_chunk_cache_path(name), self.seed, None if self.infinite else MAX_SIZE)
+        # 已生成的区块及其占用的内存, 按最近使用的顺序排列
+        self.generated = OrderedDict()
+        self.generated_memory = 0
+        # 生成区块的进程池, 以及正在工作进程中生成的区块
+        self.executor = None
+        self.pending = {}
+        # 区块中每一列的方块颜色, 按色图名称保存, 下标为 (z & 15) << 4 | (x & 15)
+        self.tints = {}
+        self.colorizers = dict((block.colorizer.name, block.colorizer) for block in block_list
+                if hasattr(block, 'colorizer'))
+        # world 存储着世界上所有的方块, 按区块保存方块 ID
+        self.world = ChunkStore(block_list, block_transparent)
+        # 按区块保存的光照, 方块改变时增量更新
+        self.light = LightEngine(self.world, block_luminance)
+        # 当前显示的区域
+        self.shown = set()
+        # 区域的网格, 值为该区域中每个贴图组和渲染层的 (是否透明, 贴图组, 顶点列表)
         self._shown = {}
-        # 记录玩家改变的方块
+        # 视距(区域), 在 settings.json 的 render-distance 中设置
+        self.render_distance = settings.get('render-distance', 8)
+        # 只显示低精度网格的远处区块, 它们的网格, 以及等待重新生成网格的区块
+        self.lod = set()
+        self._lod = {}
+        self._lod_dirty = set()
+        # 玩家所在的区域, 以及由远到近排列的含有透明方块的网格, 为 None 时需要重新排序
+        self.center = None
+        self._transparent_order = None
+        # 上一帧绘制的区域和低精度区块数, 以及在视锥体外而跳过的数量, 显示在调试信息中
+        self.drawn_sectors = self.culled_sectors = 0
+        # 生成网格的线程池, 以及正在其中生成网格的区域
+        self.mesher = None
+        self.meshing = {}
+        # 是否用贪婪网格合并相邻的相同面, 在 settings.json 的 greedy-mesh 中设置
+        self.build_mesh = build_sector_mesh_greedy if settings.get('greedy-mesh', False) else build_sector_mesh
+        # 正在绘制的三角形数量, 以及不剔除隐藏面时的数量, 显示在调试信息中
+        self.triangles = self.full_triangles = 0
+        self._triangles = {}
+        # 记录玩家改变的方块, 值为方块 ID
         self.change = {}
-        self.sectors = {}
+        # 按区块索引的玩家更改, 在区块重新生成时应用
+        self._chunk_change = {}
         self.queue = deque()
         # 初始化是否完成
         self.is_init = True
 
     def init_world(self):
-        # 放置所有方块以初始化世界, 非常耗时
-        get_game().loading.draw()
+        """
+        分阶段初始化世界: 生成地形, 重新应用玩家的更改, 绘制出生点附近的区域.
+        这是一个生成器, 每次迭代只完成一小步, 由 Game 在每一帧中迭代一段时间, 使窗口在加载时仍能响应
+
+        :return: 每一步产生 (阶段, 进度), 阶段为 LOADING_GENERATE, LOADING_CHANGES 或 LOADING_MESH, 进度取值 0 到 1
+        """
         log_info('Generate terrain...')
         now = time.time()
+        if self.cache is not None:
+            self.cache.clean()
         if saves.load_level(self.name)['type'] == 'flat':
-            self.init_flat_world()
+            yield from self.init_flat_world()
+        elif self.infinite:
+            # 只生成玩家所在的区块, 其他区块在 change_chunk 时生成
+            position = get_game().player['position']
+            x, y, z = normalize(position) if len(position) == 3 else (0, 0, 0)
+            self.generate_chunk(x // SECTOR_SIZE, z // SECTOR_SIZE)
+            yield LOADING_GENERATE, 1
         else:
-            self.init_random_world()
+            yield from self.init_random_world()
         log_info('Generate done, takes %s seconds' % round(time.time() - now, 2))
-        saves.load_block(self.name)
+        changes = saves.load_changes(self.name)
+        for i in range(0, len(changes), 1024):
+            self.set_many(changes[i: i + 1024], immediate=False)
+            yield LOADING_CHANGES, min(1, (i + 1024) / len(changes))
+        player = get_game().player
+        if len(player['position']) != 3:
+            player['position'] = player['respawn_position'] = (0, self.get_highest_block(0, 0) + 3, 0)
+        yield from self.init_spawn(sectorize(player['position']))
         self.is_init = False
 
+    def init_spawn(self, sector):
+        # 绘制出生点附近的区域, 无限世界还要等待出生点周围的区块生成完成
+        self.change_chunk(None, sector)
+        nearby = [(sector[0] + dx, sector[2] + dz) for dx in (-1, 0, 1) for dz in (-1, 0, 1)]
+        while any(chunk in self.pending for chunk in nearby):
+            self.process_chunks(time.perf_counter() + 1.0 / TICKS_PER_SEC)
+            done = sum(chunk in self.generated for chunk in nearby)
+            yield LOADING_MESH, done / len(nearby) / 2
+        # 只等待出生点所在的区域及其相邻区域, 其余的网格在进入游戏后由 process_meshes 陆续上传
+        spawn = [s for s in self.shown if max(abs(i - j) for i, j in zip(s, sector)) <= 1]
+        total = max(1, sum(s in self.meshing for s in spawn))
+        while any(s in self.meshing for s in spawn):
+            self.process_meshes(time.perf_counter() + 1.0 / TICKS_PER_SEC)
+            yield LOADING_MESH, 1 - sum(s in self.meshing for s in spawn) / total / 2
+
     def init_flat_world(self):
-        # 生成平坦世界
-        for x in range(-MAX_SIZE, MAX_SIZE + 1):
-            for z in range(-MAX_SIZE, MAX_SIZE + 1):
-                self.add_block((x, 0, z), 'bedrock', immediate=False, record=False)
-                for y in range(1, 6):
-                    self.add_block((x, 5, z), 'dirt', immediate=False, record=False)
-                self.add_block((x, 6, z), 'grass', immediate=False, record=False)
+        # 生成平坦世界, 每个区块直接用层模板整体写入, 区域在进入视野时由 change_chunk 绘制
+        chunks = [(cx, cz) for cx in range(-MAX_SIZE // SECTOR_SIZE, MAX_SIZE // SECTOR_SIZE + 1)
+                for cz in range(-MAX_SIZE // SECTOR_SIZE, MAX_SIZE // SECTOR_SIZE + 1)]
+        for i, (cx, cz) in enumerate(chunks):
+            self.load_chunk(cx, cz, *self.generator.generate(cx, cz, MAX_SIZE))
+            yield LOADING_GENERATE, (i + 1) / len(chunks)
 
     def init_random_world(self):
-        # 生成随机世界
-        trees = []
-        for x in range(-MAX_SIZE, MAX_SIZE + 1):
-            for z in range(-MAX_SIZE, MAX_SIZE + 1):
-                self.add_block((x, 0, z), 'bedrock', immediate=False, record=False)
-                h = int(self.simplex.noise2(x=x / 25, y=z / 25) * 3 + SEA_LEVEL)
-                if (0.511 < self.simplex.noise2(x=x, y=z) < 0.512) or (0.301 < self.simplex.noise2(x=x, y=z) < 0.302):
-                    trees.append((x, z))
-                for y in range(1, h + 1):
-                    self.add_block((x, y, z), 'dirt', immediate=False, record=False)
-                self.add_block((x, h + 1, z), 'grass', immediate=False, record=False)
-        self.add_trees(trees)
-
-    def add_trees(self, tree_list):
-        for pos in tree_list:
-            highest_block = self.get_highest_block(*pos) + 1
-            for y in range(highest_block, highest_block + 5):
-                self.add_block((pos[0], y, pos[1]), 'log', immediate=False, record=False)
-            y = highest_block + 4
-            for dx, dy, dz in LEAF_SHAPE['oak_normal']:
-                self.add_block((pos[0] + dx, y + dy, pos[1] + dz), 'leaf', immediate=False, record=False)
+        # 生成随机世界, 地形和树木按区块整体在进程池中生成并直接写入区块存储, 区域在进入视野时由 change_chunk 绘制
+        chunks = [(cx, cz) for cx in range(-MAX_SIZE // SECTOR_SIZE, MAX_SIZE // SECTOR_SIZE + 1)
+                for cz in range(-MAX_SIZE // SECTOR_SIZE, MAX_SIZE // SECTOR_SIZE + 1)]
+        executor = self.get_executor()
+        futures = dict()
+        if executor is not None:
+            try:
+                for cx, cz in chunks:
+                    futures[(cx, cz)] = executor.submit(generate_chunk, self.seed, block_ids, cx, cz, MAX_SIZE, self.cache)
+            except Exception as err:
+                log_err('Cannot submit chunks to workers, generate in main thread: %s' % err)
+        for i, (cx, cz) in enumerate(chunks):
+            future = futures.pop((cx, cz), None)
+            if future is None:
+                result = generate_chunk(self.seed, block_ids, cx, cz, MAX_SIZE, self.cache)
+            else:
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # 进程池中的进程出错或退出时, 剩下的区块在主线程中生成
+                    log_err('Chunk worker failed at %s: %s' % ((cx, cz), err))
+                    result = self.generator.generate(cx, cz, MAX_SIZE)
+            self.load_chunk(cx, cz, *result)
+            yield LOADING_GENERATE, (i + 1) / len(chunks)
+
+    def is_generated(self, position):
+        # 坐标所在的区块是否已经生成, 非无限世界总是返回 True
+        return (not self.infinite) or ((position[0] // SECTOR_SIZE, position[2] // SECTOR_SIZE) in self.generated)
+
+    def get_executor(self):
+        # 返回生成区块的进程池, 无法创建进程时返回 None, 此时在主线程中生成
+        if self.executor is None:
+            try:
+                self.executor = ProcessPoolExecutor()
+            except (OSError, NotImplementedError) as err:
+                log_warn('Cannot start chunk workers, generate in main thread: %s' % err)
+                self.executor = False
+        return self.executor or None
+
+    def generate_chunk(self, cx, cz):
+        # 在主线程中立即生成无限世界中的一个区块
+        self.load_generated(cx, cz, *generate_chunk(self.seed, block_ids, cx, cz, cache=self.cache))
+
+    def request_chunk(self, cx, cz):
+        # 把区块交给进程池生成, 生成完成后由 process_chunks 写入世界
+        if (cx, cz) in self.generated or (cx, cz) in self.pending:
+            return
+        executor = self.get_executor()
+        if executor is None:
+            self.generate_chunk(cx, cz)
+        else:
+            self.pending[(cx, cz)] = executor.submit(generate_chunk, self.seed, block_ids, cx, cz, cache=self.cache)
+
+    def process_chunks(self, deadline):
+        # 把已经生成完成的区块写入世界, 直到 deadline(time.perf_counter 的值)为止
+        for chunk, future in list(self.pending.items()):
+            if time.perf_counter() >= deadline:
+                break
+            if not future.done():
+                continue
+            del self.pending[chunk]
+            try:
+                result = future.result()
+            except Exception as err:
+                log_err('Chunk worker failed at %s: %s' % (chunk, err))
+                result = self.generator.generate(*chunk)
+            self.load_generated(*chunk, *result)
+
+    def load_chunk(self, cx, cz, bottom, blocks, climate):
+        """
+        把生成器的结果写入区块存储, 并按气候预先求出区块中每一列的方块颜色
+
+        :param: cx, cz 区块坐标
+        :param: bottom, blocks, climate 生成器 generate 方法的返回值
+        """
+        self.world.load_chunk(cx, cz, bottom, blocks)
+        tints = dict()
+        for name, colorizer in self.colorizers.items():
+            tints[name] = [tuple(color) for color in colorizer.get_colors(*climate).reshape(-1, 3).tolist()]
+        self.tints[(cx, cz)] = tints
+        # 光照可能传播到相邻区块中
+        sectors = set()
+        for position in self.light.load_chunk(cx, cz):
+            sectors.update(self._block_sectors(position))
+        for sector in sectors:
+            self.refresh_sector(sector, False)
+
+    def get_tint(self, position, colorizer):
+        # 返回 position 所在列的方块颜色, 区块没有气候数据时使用默认气候
+        tints = self.tints.get((position[0] // SECTOR_SIZE, position[2] // SECTOR_SIZE))
+        if tints is None:
+            return colorizer.get_color(*DEFAULT_CLIMATE)
+        return tints[colorizer.name][((position[2] & 15) << 4) | (position[0] & 15)]
+
+    def load_generated(self, cx, cz, bottom, blocks, climate):
+        """
+        把生成好的区块写入世界, 结果只取决于种子和区块坐标,
+        之后重新应用玩家在该区块中的更改, 并绘制视野内受影响的区域
+
+        :param: cx, cz 区块坐标
+        :param: bottom, blocks, climate RandomGenerator.generate 的返回值
+        """
+        self.load_chunk(cx, cz, bottom, blocks, climate)
+        memory = self.world.chunk_memory(cx, cz) + self.light.chunk_memory(cx, cz)
+        self.generated[(cx, cz)] = memory
+        self.generated_memory += memory
+        changes = self._chunk_change.get((cx, cz))
+        if changes:
+            self.set_many(list(changes.items()), immediate=False, record=False)
+        # 相邻区块边界上的方块可能被新区块挡住
+        for sector in list(self.shown):
+            if abs(sector[0] - cx) + abs(sector[2] - cz) <= 1:
+                self.refresh_sector(sector, False)
+        for dx, dz in ((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)):
+            self.refresh_lod((cx + dx, cz + dz))
+
+    def shutdown(self):
+        # 取消尚未完成的区块和网格, 并关闭进程池和线程池
+        for future in list(self.pending.values()) + list(self.meshing.values()):
+            future.cancel()
+        self.pending.clear()
+        self.meshing.clear()
+        if self.executor:
+            self.executor.shutdown(wait=False)
+        self.executor = None
+        if self.mesher is not None:
+            self.mesher.shutdown(wait=False)
+        self.mesher = None
+
+    def unload_chunk(self, cx, cz):
+        # 从内存中移除已生成的区块, 玩家的更改仍然保存在 change 中
+        for sector in self.world.chunk_sectors(cx, cz):
+            self.hide_sector(sector)
+        self.world.unload_chunk(cx, cz)
+        self.light.unload_chunk(cx, cz)
+        self.tints.pop((cx, cz), None)
+        self.generated_memory -= self.generated.pop((cx, cz))
+        # 相邻区块边界上朝向这里的面重新变为可见
+        for sector in list(self.shown):
+            if abs(sector[0] - cx) + abs(sector[2] - cz) == 1:
+                self.refresh_sector(sector, False)
+        for dx, dz in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            self.refresh_lod((cx + dx, cz + dz))
+
+    def _trim_generated(self, keep):
+        # 已生成区块的内存超过 CHUNK_MEMORY_LIMIT 时, 移除最久未使用且不在 keep 中的区块
+        for chunk in keep:
+            if chunk in self.generated:
+                self.generated.move_to_end(chunk)
+        for chunk in list(self.generated.keys()):
+            if self.generated_memory <= CHUNK_MEMORY_LIMIT:
+                break
+            if chunk not in keep:
+                self.unload_chunk(*chunk)
 
     def hit_test(self, position, vector, max_distance=8):
         """
@@ -109,49 +320,48 @@ class World(object):
             return None, None
 
     def exposed(self, position):
-        # 如果 position 所有的六个面旁边都有方块, 返回 False. 否则返回 True
-        x, y, z = position
-        for dx, dy, dz in FACES:
-            pos = (x + dx, y + dy, z + dz)
-            if  self.world.get(pos) is None:
-                return True
-        else:
-            return False
+        # 如果 position 所有的六个面旁边都有不透明方块, 返回 False. 否则返回 True
+        return self.world.get_faces(position) != 0
 
     def get_highest_block(self, x, z):
-        high = 0
-        for y in range(-64, 513):
-            if (x, y, z) in self.world:
-                high = y
-        return high
+        # 返回 x, z 列最高方块的 y 坐标, 空列返回 0. 由高度图提供, 时间复杂度 O(1)
+        high = self.world.get_height(x, z)
+        return high if high >= MIN_HEIGHT else 0
 
     def add_block(self, position, block, immediate=True, record=True):
         """
         在 position 处添加一个方块
 
         :param: pssition 长度为3的元组, 要添加方块的位置
-        :param: block 方块
+        :param: block 方块名称或方块 ID
         :param: immediate 是否立即绘制方块
         :param: record 是否记录方块更改(在生成地形时不记录)
         """
+        block_id = get_block_id(block)
+        if block_id == 0:
+            # 放置空气等同于移除方块
+            self.remove_block(position, immediate, record)
+            return
         if position in self.world:
-            self.remove_block(position, immediate, record=False)
+            # 原有的方块和新方块一起由下面的 refresh_block 重新绘制
+            self._destroy_block(position)
         if -64 <= position[1] < 512:
             # 建筑限制为-64格以上, 512格以下
+            if not self.is_generated(position):
+                # 区块生成时会应用这次更改
+                if record:
+                    self._record(position, block_id)
+                return
             if record == True:
-                self.change[pos2str(position)] = block
-            if block in blocks:
-                self.world[position] = blocks[block]
-                self.world[position].on_build(position)
-                self.world[position].position = position
-            else:
-                # 将不存在的方块替换为 missing
-                self.world[position] = blocks['missing']
-            self.sectors.setdefault(sectorize(position), []).append(position)
-            if self.exposed(position):
-                self.show_block(position)
-            if not self.world[position].transparent:
+                self._record(position, block_id)
+            # 不存在的方块会被替换为 missing
+            block = block_list[block_id]
+            self.world.set_id(position, block_id)
+            block.on_build(position)
+            block.position = position
+            if not block_transparent[block_id]:
                 self.check_neighbors(position)
+            self.refresh_block(position, immediate)
         else:
             if position[1] >= 512:
                 get_game().dialogue.add_dialogue(resource_pack.get_translation('game.text.build_out_of_world')[0] % 512)
@@ -164,135 +374,349 @@ class World(object):
 
         :param: position 长度为3的元组, 要移除方块的位置
         :param: immediate 是否要从画布上立即移除方块
-        :param: record 是否记录方块更改(在 add_block 破坏后放置时不记录)
+        :param: record 是否记录方块更改
         """
         if position in self.world:
             # 不加这个坐标是否存在于世界中的判断有极大概率会抛出异常
-            self.world[position].on_destroy(position)
-            del self.world[position]
+            self._destroy_block(position)
             if record:
-                self.change[pos2str(position)] = 'air'
-            self.sectors[sectorize(position)].remove(position)
-            if position in self.shown:
-                self.hide_block(position)
+                self._record(position, 0)
+            self.refresh_block(position, immediate)
+
+    def _destroy_block(self, position):
+        # 移除 position 处的方块并通知相邻方块, 不记录更改也不重新绘制
+        block = self.world[position]
+        block.on_destroy(position)
+        del self.world[position]
+        if not block.transparent:
             self.check_neighbors(position)
 
     def get(self, position):
         return self.world.get(position, None)
 
+    def set_many(self, changes, immediate=True, record=True):
+        """
+        批量修改方块. 先写入所有方块, 再一起记录更改、更新光照, 并对每个涉及的区域重新生成一次网格,
+        避免像 add_block 那样对每个方块都检查相邻方块. 与原有方块相同的更改也会被记录, 以免保存时丢失
+
+        :param: changes 可迭代对象, 元素为 (坐标, 方块名称或方块 ID), 方块为 0 或 'air' 时移除方块
+        :param: immediate 是否立即绘制方块
+        :param: record 是否记录方块更改
+        """
+        changed = list()
+        records = dict()
+        for position, block in changes:
+            if not -64 <= position[1] < 512:
+                continue
+            block_id = get_block_id(block)
+            if record:
+                records[position] = block_id
+            if not self.is_generated(position):
+                continue
+            old = self.world.get_id(position)
+            if old == block_id:
+                continue
+            if old != 0:
+                block_list[old].on_destroy(position)
+            self.world.set_id(position, block_id)
+            if block_id != 0:
+                block = block_list[block_id]
+                block.on_build(position)
+                block.position = position
+            changed.append(position)
+        self._record_many(records)
+        self.refresh_positions(changed, immediate)
+        for chunk in set((x // SECTOR_SIZE, z // SECTOR_SIZE) for x, y, z in changed):
+            self.refresh_lod(chunk)
+
+    def _block_sectors(self, position):
+        # 返回方块改变后需要重新生成网格的区域, 区域边界上的方块也会改变相邻区域中方块的可见面
+        sector = sectorize(position)
+        sectors = [sector]
+        for i in range(3):
+            if position[i] % SECTOR_SIZE == 0:
+                sectors.append(sector[:i] + (sector[i] - 1,) + sector[i + 1:])
+            elif position[i] % SECTOR_SIZE == SECTOR_SIZE - 1:
+                sectors.append(sector[:i] + (sector[i] + 1,) + sector[i + 1:])
+        return sectors
+
+    def _record(self, position, block_id):
+        # 记录玩家对方块的更改
+        self._record_many({position: block_id})
+
+    def _record_many(self, records):
+        # 一次记录多个更改, records 的键为坐标, 值为方块 ID
+        self.change.update((pos2str(position), block_id) for position, block_id in records.items())
+        for position, block_id in records.items():
+            self._chunk_change.setdefault((position[0] // SECTOR_SIZE, position[2] // SECTOR_SIZE), {})[position] = block_id
+
+    def fill(self, start, end, block, immediate=True, record=True):
+        """
+        用方块填充 start 和 end 之间(包括两端)的长方体区域
+
+        :param: start, end 长度为3的元组, 区域的两个对角
+        :param: block 方块名称或方块 ID
+        """
+        self.set_many(((position, block) for position in self._box(start, end)), immediate, record)
+
+    def replace(self, start, end, old, new, immediate=True, record=True):
+        """
+        将 start 和 end 之间(包括两端)的长方体区域中的 old 方块替换为 new 方块
+
+        :param: old, new 方块名称或方块 ID
+        """
+        old = get_block_id(old)
+        self.set_many(((position, new) for position in self._box(start, end)
+            if self.world.get_id(position) == old), immediate, record)
+
+    def _box(self, start, end):
+        (x0, x1), (y0, y1), (z0, z1) = [sorted(i) for i in zip(start, end)]
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                for z in range(z0, z1 + 1):
+                    yield (x, y, z)
+
     def check_neighbors(self, position):
-        # 检查 position 周围所有的方块, 确保它们的状态是最新的.
-        # 这意味着将隐藏不可见的方块, 并显示可见的方块.
-        # 通常在添加或删除方块时使用.
+        # 通知 position 周围所有的方块它们的相邻方块发生了变化, 通常在添加或删除不透明方块时使用.
+        # 可见面掩码由 ChunkStore 维护, 网格由 refresh_block 重新生成
         x, y, z = position
         for dx, dy, dz in FACES:
             key = (x + dx, y + dy, z + dz)
-            if key not in self.world:
+            block = self.world.get(key)
+            if block is None:
                 continue
-            if self.exposed(key):
-                if key not in self.shown:
-                    self.world[key].on_neighbor_change(key, position)
-                    self.show_block(key)
-            else:
-                if key in self.shown:
-                    self.world[key].on_neighbor_change(key, position)
-                    self.hide_block(key)
+            block.on_neighbor_change(key, position)
 
-    def show_block(self, position, immediate=True):
+    def refresh_block(self, position, immediate=True):
         """
-        在 position 处显示方块, 这个方法假设方块在 add_block() 已经添加
+        方块改变后更新光照, 并重新生成它所在区域的网格
 
-        :param: position 长度为3的元组, 要显示方块的位置
-        :param: immediate 是否立即显示方块
+        :param: position 长度为3的元组, 改变的方块的位置
+        :param: immediate 是否立即生成网格
         """
-        block = self.world[position]
-        self.shown[position] = block
+        self.refresh_positions([position], immediate)
+        self.refresh_lod((position[0] // SECTOR_SIZE, position[2] // SECTOR_SIZE))
+
+    def refresh_positions(self, positions, immediate=True):
+        """
+        方块改变后增量更新光照, 再重新生成这些方块以及光照改变了的格子所在区域的网格, 每个区域只生成一次
+
+        :param: positions 改变的方块的坐标
+        :param: immediate 是否立即生成网格
+        """
+        positions = set(positions)
+        sectors = set()
+        for position in positions | self.light.update(positions):
+            sectors.update(self._block_sectors(position))
+        for sector in sectors:
+            self.refresh_sector(sector, immediate)
+
+    def refresh_sector(self, sector, immediate=True):
+        """
+        如果区域正在显示, 按最新的方块重新生成它的网格.
+        不立即生成时交给线程池, 完成后由 process_meshes 上传, 之前提交的结果会被丢弃
+
+        :param: sector 区域坐标
+        :param: immediate 是否在主线程中立即生成网格
+        """
+        if sector not in self.shown:
+            return
+        future = self.meshing.pop(sector, None)
+        if future is not None:
+            future.cancel()
         if immediate:
-            self._show_block(position, block)
+            self._upload_sector(sector, self._build_sector(sector))
         else:
-            self._enqueue(self._show_block, position, block)
+            if self.mesher is None:
+                # 纯 Python 的网格生成受 GIL 限制, 多个线程并不会更快, 一个线程足以让主线程不被阻塞
+                self.mesher = ThreadPoolExecutor(max_workers=1)
+            self.meshing[sector] = self.mesher.submit(self._build_sector, sector)
 
-    def _show_block(self, position, block):
+    def show_sector(self, sector, immediate=False):
         """
-        show_block() 方法的私有实现
+        显示区域, 网格默认在线程池中生成
 
-        :param: position 长度为3的元组, 要显示方块的位置
-        :param: block 方块
+        :param: sector 区域坐标
+        :param: immediate 是否立即生成网格
         """
-        vertex_data = list(block.get_vertices(*position))
-        texture_data = list(block.texture_data)
-        count = len(texture_data) // 2
-        if hasattr(block, 'get_color'):
-            color = block.get_color(0.8, 0.4, 16)
-        else:
-            color = get_color_by_brightness(16) * count
-        batch = self.batch3d
-        if not block.transparent:
-            self._shown[position] = self.batch3d.add(count, GL_QUADS, block.group,
-                    ('v3f/static', vertex_data),
-                    ('t2f/static', texture_data),
-                    ('c3f/static', color))
-        else:
-            self._shown[position] = self.batch3d_transparent.add(count, GL_QUADS, block.group,
-                    ('v3f/static', vertex_data),
-                    ('t2f/static', texture_data),
-                    ('c3f/static', color))
+        self.shown.add(sector)
+        self.refresh_sector(sector, immediate)
 
-    def get_color(self, position):
-        self._shown[position].vertices
+    def hide_sector(self, sector):
+        # 隐藏区域并立即删除它的网格
+        self.shown.discard(sector)
+        future = self.meshing.pop(sector, None)
+        if future is not None:
+            future.cancel()
+        self._upload_sector(sector, None)
+
+    def process_meshes(self, deadline):
+        # 上传已经在线程池中生成完成的网格, 直到 deadline(time.perf_counter 的值)为止
+        for sector, future in list(self.meshing.items()):
+            if time.perf_counter() >= deadline:
+                break
+            if not future.done():
+                continue
+            del self.meshing[sector]
+            try:
+                mesh = future.result()
+            except Exception as err:
+                log_err('Mesh worker failed at %s: %s' % (sector, err))
+                mesh = self._build_sector(sector)
+            self._upload_sector(sector, mesh)
+
+    def _build_sector(self, sector):
+        """
+        生成区域的网格, 可以在线程池中调用. 生成期间方块被改变时, 改变方块的一方会重新提交这个区域,
+        因此读到不一致的方块也没有关系, 这次的结果会被丢弃
 
-    def hide_block(self, position, immediate=True):
+        :param: sector 区域坐标
+        :return: pack_mesh 的返回值
         """
-        隐藏在 position 处的方块, 它不移除方块
+        return pack_mesh(self.build_mesh(self.world, sector, self.get_tint, self.light.get_region))
 
-        :param: position 长度为3的元组, 要隐藏方块的位置
-        :param: immediate 是否立即隐藏方块
+    def _upload_sector(self, sector, mesh):
         """
-        self.shown.pop(position)
-        if immediate:
-            self._hide_block(position)
-        else:
-            self._enqueue(self._hide_block, position)
+        删除区域原有的网格, 如果区域仍在显示, 则上传新的网格.
+        区域中同一贴图组、同一渲染层的方块共用一个顶点列表
 
-    def _hide_block(self, position):
-        # hide_block() 方法的私有实现
-        self._shown.pop(position).delete()
+        :param: sector 区域坐标
+        :param: mesh _build_sector 的返回值, 为 None 时只删除网格
+        """
+        self._delete_mesh(self._shown.pop(sector, ()))
+        triangles, full_triangles = self._triangles.pop(sector, (0, 0))
+        self.triangles -= triangles
+        self.full_triangles -= full_triangles
+        if sector not in self.shown or not mesh:
+            return
+        self._shown[sector] = self._add_mesh(mesh)
+        # 每个四边形是两个三角形
+        triangles = sum(data[0] for data in mesh.values()) // 2
+        # 每个方块六个面共十二个三角形
+        section = self.world.get_section(sector)
+        full_triangles = section.count * 12 if section is not None else 0
+        self._triangles[sector] = triangles, full_triangles
+        self.triangles += triangles
+        self.full_triangles += full_triangles
+
+    def _add_mesh(self, mesh):
+        """
+        上传网格, 含有透明方块时需要重新排序透明网格
 
-    def show_sector(self, sector):
-        # 确保该区域中的方块都会被绘制
-        for position in self.sectors.get(sector, []):
-            if position not in self.shown and self.exposed(position):
-                self.show_block(position, False)
+        :param: mesh pack_mesh 的返回值
+        :return: 列表, 元素为 (是否透明, 贴图组, 顶点列表)
+        """
+        vertex_lists = []
+        for (transparent, group), (count, *arrays) in mesh.items():
+            batch = self.batch3d_transparent if transparent else self.batch3d
+            vertex_lists.append((transparent, group, self._add_vertex_list(batch, group, count, *arrays)))
+            if transparent:
+                self._transparent_order = None
+        return vertex_lists
+
+    def _delete_mesh(self, vertex_lists):
+        # 删除 _add_mesh 上传的网格
+        for transparent, group, vertex_list in vertex_lists:
+            vertex_list.delete()
+            if transparent:
+                self._transparent_order = None
+
+    def _add_vertex_list(self, batch, group, count, *arrays):
+        """
+        创建空的顶点列表, 再把 float32 数组按列整块写入交错存储的顶点缓冲,
+        比逐个元素复制 Python 列表快得多
 
-    def hide_sector(self, sector):
-        # 隐藏区域
-        for position in self.sectors.get(sector, []):
-            if position in self.shown:
-                self.hide_block(position, False)
+        :param: batch, group 顶点列表所在的 Batch 和贴图组
+        :param: count 顶点数
+        :param: arrays 顶点坐标, 纹理坐标, 颜色和光照贴图坐标
+        """
+        # 方块贴图和光照贴图分别使用第 0 和第 1 个纹理单元的纹理坐标
+        vertex_list = batch.add(count, GL_QUADS, group, 'v3f/static', '0t2f/static', 'c3f/static', '1t2f/static')
+        for attribute, data in zip(vertex_list.domain.attributes, arrays):
+            stride = attribute.stride // ctypes.sizeof(ctypes.c_float)
+            offset = attribute.offset // ctypes.sizeof(ctypes.c_float)
+            region = attribute.buffer.get_region(attribute.stride * vertex_list.start, attribute.stride * count,
+                    ctypes.POINTER(ctypes.c_float * (stride * count)))
+            view = np.ctypeslib.as_array(region.array).reshape(count, stride)
+            view[:, offset: offset + attribute.count] = data.reshape(count, attribute.count)
+            region.invalidate()
+        return vertex_list
+
+    def refresh_lod(self, chunk):
+        # 如果区块正在显示低精度网格, 在队列中重新生成它
+        if chunk in self.lod and chunk not in self._lod_dirty:
+            self._lod_dirty.add(chunk)
+            self._enqueue(self._update_lod, chunk)
+
+    def _update_lod(self, chunk):
+        """
+        删除区块原有的低精度网格, 如果区块仍然只显示低精度网格, 则为它生成新的网格
+
+        :param: chunk 区块坐标
+        """
+        self._lod_dirty.discard(chunk)
+        self._delete_mesh(self._lod.pop(chunk, ()))
+        if chunk not in self.lod:
+            return
+        mesh = pack_mesh(build_chunk_lod(self.world, *chunk, self.get_tint))
+        if mesh:
+            self._lod[chunk] = self._add_mesh(mesh)
+
+    def get_visible(self, sector):
+        """
+        返回玩家位于 sector 时显示的区域, 以及只显示低精度网格的区块.
+        LOD_DISTANCE 以内的区域绘制完整的网格, 其外直到视距的区块只绘制低精度网格
+
+        :param: sector 玩家所在的区域, 为 None 时都为空
+        :return: (区域坐标的集合, 区块坐标的集合)
+        """
+        sectors, chunks = set(), set()
+        if sector is None:
+            return sectors, chunks
+        x, y, z = sector
+        distance = self.render_distance
+        detail = min(distance, LOD_DISTANCE)
+        for dx in range(-distance, distance + 1):
+            for dz in range(-distance, distance + 1):
+                d = dx ** 2 + dz ** 2
+                if d > (distance + 1) ** 2:
+                    continue
+                if d > (detail + 1) ** 2:
+                    chunks.add((x + dx, z + dz))
+                    continue
+                for dy in range(-detail, detail + 1):
+                    if d + dy ** 2 <= (detail + 1) ** 2:
+                        sectors.add((x + dx, y + dy, z + dz))
+        return sectors, chunks
 
     def change_chunk(self, before, after):
         # 改变玩家所在区域
-        before_set = set()
-        after_set = set()
-        pad = 4
-        for dx in range(-pad, pad + 1):
-            for dy in [0]:
-                for dz in range(-pad, pad + 1):
-                    if dx ** 2 + dy ** 2 + dz ** 2 > (pad + 1) ** 2:
-                        continue
-                    if before:
-                        x, y, z = before
-                        before_set.add((x + dx, y + dy, z + dz))
-                    if after:
-                        x, y, z = after
-                        after_set.add((x + dx, y + dy, z + dz))
-        else:
-            show = after_set - before_set
-            hide = before_set - after_set
-            for sector in show:
-                self.show_sector(sector)
-            for sector in hide:
-                self.hide_sector(sector)
+        before_set, before_lod = self.get_visible(before)
+        after_set, after_lod = self.get_visible(after)
+        if self.infinite and after:
+            # 由近到远请求生成进入视野的区块, 取消已经离开视野的区块, 并在内存不足时移除远处的区块
+            columns = set((x, z) for x, y, z in after_set) | after_lod
+            for chunk in list(self.pending.keys()):
+                if chunk not in columns and self.pending[chunk].cancel():
+                    del self.pending[chunk]
+            for chunk in sorted(columns, key=lambda c: (c[0] - after[0]) ** 2 + (c[1] - after[2]) ** 2):
+                self.request_chunk(*chunk)
+            self._trim_generated(columns)
+        self.center = after
+        self._transparent_order = None
+        show = after_set - before_set
+        hide = before_set - after_set
+        # 由近到远生成网格
+        for sector in sorted(show, key=lambda s: sum((i - j) ** 2 for i, j in zip(s, after))):
+            self.show_sector(sector)
+        for sector in hide:
+            self.hide_sector(sector)
+        for chunk in before_lod - after_lod:
+            self.lod.discard(chunk)
+            self._update_lod(chunk)
+        for chunk in sorted(after_lod - before_lod, key=lambda c: (c[0] - after[0]) ** 2 + (c[1] - after[2]) ** 2):
+            self.lod.add(chunk)
+            self.refresh_lod(chunk)
 
     def _enqueue(self, func, *args):
         # 把 func 添加到内部的队列
@@ -307,14 +731,89 @@ class World(object):
         # 处理事件
         if not self.is_init:
             start = time.perf_counter()
-            while self.queue and time.perf_counter() - start < 1.0 / TICKS_PER_SEC:
+            deadline = start + 1.0 / TICKS_PER_SEC
+            self.process_chunks(deadline)
+            self.process_meshes(deadline)
+            while self.queue and time.perf_counter() < deadline:
                 self._dequeue()
 
     def process_entire_queue(self):
-        # 处理所有事件
+        # 处理所有事件, 并等待线程池生成完所有网格
         while self.queue:
             self._dequeue()
+        for future in list(self.meshing.values()):
+            future.exception()
+        self.process_meshes(float('inf'))
+
+    def sort_transparent(self):
+        """
+        把含有透明方块的区域和低精度区块按到玩家所在区域的距离由远到近排序.
+        只在玩家跨过区域边界或者透明网格改变时调用, 而不是每一帧
+
+        :return: 列表, 元素为 (区域或区块坐标, 网格)
+        """
+        if self.center is None:
+            return []
+        x, y, z = self.center
+        order = []
+        for sector, vertex_lists in self._shown.items():
+            if any(transparent for transparent, group, vertex_list in vertex_lists):
+                order.append(((sector[0] - x) ** 2 + (sector[1] - y) ** 2 + (sector[2] - z) ** 2, sector, vertex_lists))
+        for chunk, vertex_lists in self._lod.items():
+            if any(transparent for transparent, group, vertex_list in vertex_lists):
+                order.append(((chunk[0] - x) ** 2 + (chunk[1] - z) ** 2, chunk, vertex_lists))
+        order.sort(key=lambda item: item[0], reverse=True)
+        return [(key, vertex_lists) for distance, key, vertex_lists in order]
 
     def draw(self):
-        self.batch3d.draw()
-        self.batch3d_transparent.draw()
+        """
+        绘制视锥体内的区域和远处区块的低精度网格, 必须在 set_3d 之后调用.
+        顶点列表仍然保存在 batch3d 和 batch3d_transparent 中, 但按区域逐个绘制.
+        先按贴图组绘制所有不透明方块, 再由远到近绘制透明方块, 使透明方块之间的混合正确.
+        绘制期间光照贴图绑定在第二个纹理单元上, 按当前的日光强度调整每个顶点的亮度
+        """
+        frustum = get_frustum()
+        sectors = list(self._shown.keys())
+        chunks = list(self._lod.keys())
+        visible = set()
+        if sectors:
+            visible.update(sector for sector, test in zip(sectors, sectors_in_frustum(frustum, sectors)) if test)
+        if chunks:
+            # 低精度网格的包围盒是整个区块
+            low = np.array([(cx * SECTOR_SIZE, MIN_HEIGHT, cz * SECTOR_SIZE) for cx, cz in chunks], dtype=np.float64) - 0.5
+            inside = boxes_in_frustum(frustum, low, low + (SECTOR_SIZE, MAX_HEIGHT - MIN_HEIGHT, SECTOR_SIZE))
+            visible.update(chunk for chunk, test in zip(chunks, inside) if test)
+        self.drawn_sectors = len(visible)
+        self.culled_sectors = len(sectors) + len(chunks) - len(visible)
+        groups = {}
+        meshes = [self._shown[sector] for sector in sectors if sector in visible]
+        meshes.extend(self._lod[chunk] for chunk in chunks if chunk in visible)
+        for vertex_lists in meshes:
+            for transparent, group, vertex_list in vertex_lists:
+                if not transparent:
+                    groups.setdefault(group, []).append(vertex_list)
+        enable_lightmap()
+        for group, vertex_lists in groups.items():
+            group.set_state_recursive()
+            for vertex_list in vertex_lists:
+                vertex_list.draw(GL_QUADS)
+            group.unset_state_recursive()
+        if self._transparent_order is None:
+            self._transparent_order = self.sort_transparent()
+        # 透明方块按顺序绘制, 只在贴图组改变时切换状态
+        current = None
+        for key, vertex_lists in self._transparent_order:
+            if key not in visible:
+                continue
+            for transparent, group, vertex_list in vertex_lists:
+                if not transparent:
+                    continue
+                if group is not current:
+                    if current is not None:
+                        current.unset_state_recursive()
+                    group.set_state_recursive()
+                    current = group
+                vertex_list.draw(GL_QUADS)
+        if current is not None:
+            current.unset_state_recursive()
+        disable_lightmap()
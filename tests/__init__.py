@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# 测试时把日志保存到临时目录, 不覆盖游戏的日志
+if 'MCPYPATH' not in os.environ:
+    os.environ['MCPYPATH'] = tempfile.mkdtemp()
+    os.mkdir(os.path.join(os.environ['MCPYPATH'], 'log'))
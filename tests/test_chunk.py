@@ -0,0 +1,63 @@
+import random
+import unittest
+
+from minecraft.utils.utils import FACES, SECTOR_SIZE
+from minecraft.world.chunk import ChunkStore, MIN_HEIGHT
+
+import numpy as np
+
+# 0 号为空气, 1 号和 3 号为透明方块
+TRANSPARENT = [True, True, False, True, False]
+CHUNKS = [(cx, cz) for cx in (-1, 0) for cz in (-1, 0)]
+
+
+class ChunkStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.store = ChunkStore([None] * len(TRANSPARENT), TRANSPARENT)
+        for cx, cz in random.Random(0).sample(CHUNKS, len(CHUNKS)):
+            self.store.load_chunk(cx, cz, -SECTOR_SIZE, self.random_blocks())
+
+    def random_blocks(self):
+        # 一半是空气的随机方块, 最底层的 y 坐标为 -16
+        blocks = self.rng.integers(1, len(TRANSPARENT), (3 * SECTOR_SIZE, SECTOR_SIZE, SECTOR_SIZE))
+        blocks[self.rng.random(blocks.shape) < 0.5] = 0
+        return blocks.astype(np.uint16)
+
+    def check(self):
+        # 逐个方块比较可见面掩码和高度图
+        for cx, cz in CHUNKS:
+            for x in range(cx * SECTOR_SIZE, (cx + 1) * SECTOR_SIZE):
+                for z in range(cz * SECTOR_SIZE, (cz + 1) * SECTOR_SIZE):
+                    height = MIN_HEIGHT - 1
+                    for y in range(-SECTOR_SIZE - 1, 2 * SECTOR_SIZE + 1):
+                        block_id = self.store.get_id((x, y, z))
+                        if block_id == 0:
+                            self.assertEqual(self.store.get_faces((x, y, z)), 0)
+                            continue
+                        height = y
+                        faces = sum(1 << i for i, (dx, dy, dz) in enumerate(FACES)
+                                if not self.store.is_opaque(self.store.get_id((x + dx, y + dy, z + dz))))
+                        self.assertEqual(self.store.get_faces((x, y, z)), faces, (x, y, z))
+                    self.assertEqual(self.store.get_height(x, z), height, (x, z))
+
+    def test_load_chunk(self):
+        self.check()
+
+    def test_set_id(self):
+        rng = random.Random(1)
+        for _ in range(2000):
+            position = (rng.randrange(-SECTOR_SIZE, SECTOR_SIZE), rng.randrange(-SECTOR_SIZE, 2 * SECTOR_SIZE),
+                    rng.randrange(-SECTOR_SIZE, SECTOR_SIZE))
+            self.store.set_id(position, rng.choice([0, 0, 1, 2, 3, 4]))
+        self.check()
+
+    def test_reload_and_unload(self):
+        self.store.load_chunk(0, 0, -SECTOR_SIZE, self.random_blocks())
+        self.store.unload_chunk(-1, 0)
+        self.check()
+
+
+if __name__ == '__main__':
+    unittest.main()
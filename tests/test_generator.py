@@ -0,0 +1,57 @@
+import unittest
+
+from minecraft.utils.utils import SECTOR_SIZE
+from minecraft.utils.leaf_shapes import LEAF_SHAPE
+from minecraft.world.generator import TREE_HEIGHT, TREE_REACH, RandomGenerator
+
+import numpy as np
+
+IDS = {'bedrock': 1, 'dirt': 2, 'grass': 3, 'leaf': 4, 'log': 5}
+# 这个种子在测试范围内有多棵跨越区块边界的树
+SEED = 2
+CHUNKS = range(-3, 3)
+
+
+class TreePassTest(unittest.TestCase):
+
+    def test_chunks_match_serial_pass(self):
+        # 逐个区块生成的结果与在整个范围内逐棵放置树木的结果相同
+        generator = RandomGenerator(SEED, IDS)
+        r = TREE_REACH
+        xs = np.arange(CHUNKS[0] * SECTOR_SIZE - r, CHUNKS[-1] * SECTOR_SIZE + SECTOR_SIZE + r, dtype=np.float64)
+        zs = xs.copy()
+        height = generator.get_height(xs, zs)
+        trees = list(zip(*np.nonzero(generator.get_trees(xs, zs))))
+        self.assertTrue(trees)
+        top = int(height.max()) + TREE_HEIGHT + 8
+        bottom, world = generator.get_terrain(height, np.ones(height.shape, dtype=bool), top)
+        world = world.copy()
+        # 逐棵放置: 树叶只填充空气, 树干覆盖其他方块
+        crossing = 0
+        for tz, tx in trees:
+            base = int(height[tz, tx]) + 2
+            for dx, dy, dz in LEAF_SHAPE['oak_normal']:
+                x, y, z = tx + dx, base + TREE_HEIGHT - 1 + dy - bottom, tz + dz
+                if 0 <= x < len(xs) and 0 <= z < len(zs) and world[y, z, x] == 0:
+                    world[y, z, x] = IDS['leaf']
+            world[base - bottom: base - bottom + TREE_HEIGHT, tz, tx] = IDS['log']
+            if (tx - r) % SECTOR_SIZE in (0, 1, SECTOR_SIZE - 2, SECTOR_SIZE - 1):
+                crossing += 1
+        self.assertTrue(crossing)
+        world = world[:, r:-r, r:-r]
+        for cx in CHUNKS:
+            for cz in CHUNKS:
+                chunk_bottom, blocks, climate = generator.generate(cx, cz)
+                x0, z0 = (cx - CHUNKS[0]) * SECTOR_SIZE, (cz - CHUNKS[0]) * SECTOR_SIZE
+                expected = np.zeros(blocks.shape, dtype=np.uint16)
+                lo, hi = max(bottom, chunk_bottom), min(bottom + len(world), chunk_bottom + len(blocks))
+                expected[lo - chunk_bottom: hi - chunk_bottom] = world[lo - bottom: hi - bottom,
+                        z0: z0 + SECTOR_SIZE, x0: x0 + SECTOR_SIZE]
+                self.assertTrue((blocks == expected).all(), (cx, cz))
+                # 数组以外的部分必须是空气
+                self.assertEqual(np.count_nonzero(world[:, z0: z0 + SECTOR_SIZE, x0: x0 + SECTOR_SIZE]),
+                        np.count_nonzero(blocks), (cx, cz))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+
+from minecraft.world.chunk import ChunkStore
+from minecraft.world.generator import RandomGenerator
+from minecraft.world.light import BLOCK, RELIGHT_LIMIT, SKY, LightEngine
+
+IDS = {'bedrock': 1, 'dirt': 2, 'grass': 3, 'leaf': 4, 'log': 5}
+# 6 号为发光的透明方块
+TRANSPARENT = [True, False, False, False, True, False, True]
+LUMINANCE = [0, 0, 0, 0, 0, 0, 14]
+CHUNKS = [(cx, cz) for cx in range(-2, 2) for cz in range(-2, 2)]
+
+
+class LightEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ChunkStore([None] * len(TRANSPARENT), TRANSPARENT)
+        generator = RandomGenerator(0, IDS)
+        for cx, cz in CHUNKS:
+            self.store.load_chunk(cx, cz, *generator.generate(cx, cz)[:2])
+        self.rng = random.Random(1)
+        self.light = LightEngine(self.store, LUMINANCE)
+        for cx, cz in self.rng.sample(CHUNKS, len(CHUNKS)):
+            self.light.load_chunk(cx, cz)
+
+    def assertRelit(self):
+        # 增量更新的结果与重新计算所有区块的光照相同
+        full = LightEngine(self.store, LUMINANCE)
+        for cx, cz in CHUNKS:
+            full.load_chunk(cx, cz)
+        for chunk in CHUNKS:
+            ours, theirs = self.light.chunks[chunk], full.chunks[chunk]
+            lo, hi = min(ours.bottom, theirs.bottom), max(ours.top, theirs.top)
+            for channel in (SKY, BLOCK):
+                self.assertTrue((ours.get_levels(channel, lo, hi) == theirs.get_levels(channel, lo, hi)).all(),
+                        (chunk, channel))
+
+    def test_load_order(self):
+        self.assertRelit()
+
+    def test_single_edits(self):
+        for _ in range(30):
+            x, z = self.rng.randrange(-30, 30), self.rng.randrange(-30, 30)
+            position = (x, self.store.get_height(x, z) + self.rng.randint(-3, 2), z)
+            self.store.set_id(position, self.rng.choice([0, 0, 2, 4, 6]))
+            self.light.update([position])
+        self.assertRelit()
+
+    def test_explosion(self):
+        x, z = 0, 0
+        y = self.store.get_height(x, z) - 2
+        positions = [(x + dx, y + dy, z + dz) for dx in range(-2, 3) for dy in range(-2, 3) for dz in range(-2, 3)]
+        for position in positions:
+            self.store.set_id(position, 0)
+        self.light.update(positions)
+        self.assertRelit()
+
+    def test_large_edit(self):
+        # 超过 RELIGHT_LIMIT 个方块时重新计算周围区块, 返回的坐标包括所有光照改变了的格子
+        before = LightEngine(self.store, LUMINANCE)
+        for cx, cz in CHUNKS:
+            before.load_chunk(cx, cz)
+        y = self.store.get_height(0, 0) - 4
+        positions = [(x, y + dy, z) for x in range(-4, 5) for dy in range(-4, 5) for z in range(-4, 5)]
+        self.assertGreater(len(positions), RELIGHT_LIMIT)
+        for position in positions:
+            self.store.set_id(position, self.rng.choice([0, 0, 2, 6]))
+        changed = self.light.update(positions)
+        self.assertRelit()
+        for x in range(-32, 32):
+            for z in range(-32, 32):
+                for y in range(-16, 64):
+                    if any(before.get_level(channel, (x, y, z)) != self.light.get_level(channel, (x, y, z))
+                            for channel in (SKY, BLOCK)):
+                        self.assertIn((x, y, z), changed)
+
+    def test_remove_light_source(self):
+        for _ in range(10):
+            x, z = self.rng.randrange(-30, 30), self.rng.randrange(-30, 30)
+            y = self.store.get_height(x, z) + 1
+            for position, block_id in (((x, y, z), 6), ((x + 1, y, z), 2), ((x, y, z), 0)):
+                self.store.set_id(position, block_id)
+                self.light.update([position])
+            self.assertRelit()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from benchmark import TEST_IDS, make_store
+from minecraft.world.generator import FlatGenerator, RandomGenerator
+from minecraft.world.mesh import build_sector_mesh, build_sector_mesh_greedy
+
+import numpy as np
+
+CHUNKS = [(cx, cz) for cx in range(-2, 2) for cz in range(-2, 2)]
+
+
+def quad_area(vertices):
+    # 每个四边形覆盖的方块面数, 即它在面内两个方向上的长度之积
+    corners = np.asarray(vertices, dtype=np.float64).reshape(-1, 4, 3)
+    size = corners.max(axis=1) - corners.min(axis=1)
+    size[size == 0] = 1
+    return np.round(size.prod(axis=1)).astype(np.int64)
+
+
+class GreedyMeshTest(unittest.TestCase):
+
+    def check(self, generator):
+        # 贪婪网格中四边形的总面积等于逐方块网格的面数
+        store = make_store(generator, CHUNKS)
+        merged = 0
+        for sector in store.sectors():
+            naive = build_sector_mesh(store, sector, None)
+            greedy = build_sector_mesh_greedy(store, sector, None)
+            # 两种网格的贴图组不同, 按渲染层比较
+            for transparent in (False, True):
+                faces = sum(data[0] // 4 for key, data in naive.items() if key[0] == transparent)
+                areas = [quad_area(data[1]) for key, data in greedy.items() if key[0] == transparent]
+                self.assertEqual(sum(int(area.sum()) for area in areas), faces, (sector, transparent))
+                merged += sum(int((area > 1).sum()) for area in areas)
+        self.assertTrue(merged)
+
+    def test_flat(self):
+        self.check(FlatGenerator('classic', TEST_IDS))
+
+    def test_random(self):
+        self.check(RandomGenerator(0, TEST_IDS))
+
+
+if __name__ == '__main__':
+    unittest.main()